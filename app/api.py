@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from aiohttp import web
+from url_utilities.batching import BATCH_WINDOW_MS, MicroBatcher, QueueFull
+from url_utilities.metrics import CONTENT_TYPE, IN_FLIGHT, REGISTRY, REQUEST_ERRORS, REQUEST_SECONDS
+from url_utilities.profiling import sampled
+from url_utilities.scoring import get_registry
+
+# Model used when a request does not select one.
+DEFAULT_MODEL = os.environ.get('SECURL_DEFAULT_MODEL', 'rf')
+
+# Largest number of URLs accepted by a single batch request.
+MAX_BATCH_SIZE = int(os.environ.get('SECURL_MAX_BATCH_SIZE', '1000'))
+
+
+def _scorer(request, body):
+    """
+    Returns the scorer of the model selected by the request body, raising a 400 error if the model does not exist.
+    """
+    name = body.get('model', DEFAULT_MODEL)
+    registry = request.app['registry']
+    if name not in registry:
+        raise web.HTTPBadRequest(text=f"Unknown model '{name}', expected one of {sorted(registry.scorers)}")
+    return registry.scorer(name)
+
+
+def _batcher(request, scorer):
+    """
+    Returns the micro-batcher of the scorer, created on the first single URL request of its model.
+    """
+    batchers = request.app['batchers']
+    if scorer.name not in batchers:
+        batchers[scorer.name] = MicroBatcher(scorer)
+    return batchers[scorer.name]
+
+
+async def _in_executor(name, function, *args):
+    """
+    Runs the blocking scoring call `function(*args)`, profiled as `name` (see `sampled`), in the default executor of
+    the event loop, which keeps serving the other requests, e.g. /healthz, meanwhile.
+    """
+    def call():
+        with sampled(name):
+            return function(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+async def _json_body(request):
+    """
+    Returns the JSON object sent with the request, raising a 400 error if the body is not a JSON object.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='The request body is not valid JSON')
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='The request body must be a JSON object')
+    return body
+
+
+async def score(request):
+    """
+    Classifies the URL of a request such as {"url": "https://bit.ly/abc123", "model": "rf"}.
+
+    The URLs of concurrent requests are scored together in micro-batches (see `url_utilities.batching`), unless
+    SECURL_BATCH_WINDOW_MS is 0. When too many URLs are already waiting, the request fails with a 503 error.
+    """
+    start = time.perf_counter()
+    body = await _json_body(request)
+    url = body.get('url')
+    if not isinstance(url, str):
+        raise web.HTTPBadRequest(text="'url' must be a string")
+    scorer = _scorer(request, body)
+    if request.app['batchers'] is None:
+        result = await _in_executor('api-score', scorer.score, url)
+    else:
+        try:
+            result = await _batcher(request, scorer).score(url)
+        except QueueFull as error:
+            raise web.HTTPServiceUnavailable(text=str(error), headers={'Retry-After': '1'})
+    REQUEST_SECONDS.labels('/score', scorer.name).observe(time.perf_counter() - start)
+    return web.json_response(result)
+
+
+async def score_batch(request):
+    """
+    Classifies the URLs of a request such as {"urls": ["https://bit.ly/abc123", ...], "model": "rf"}, returning the
+    results in the same order.
+    """
+    start = time.perf_counter()
+    body = await _json_body(request)
+    urls = body.get('urls')
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        raise web.HTTPBadRequest(text="'urls' must be a list of strings")
+    if len(urls) > MAX_BATCH_SIZE:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_BATCH_SIZE, actual_size=len(urls))
+    scorer = _scorer(request, body)
+    results = await _in_executor('api-score-batch', scorer.score_batch, urls)
+    REQUEST_SECONDS.labels('/score/batch', scorer.name).observe(time.perf_counter() - start)
+    return web.json_response({'results': results})
+
+
+async def health(request):
+    registry = request.app['registry']
+    cache = registry.cache.stats() if registry.cache is not None else None
+    return web.json_response({'status': 'ok', 'models': sorted(registry.scorers), 'cache': cache})
+
+
+async def metrics(request):
+    """
+    Returns the metrics of the process in the Prometheus text format, see `url_utilities.metrics`.
+    """
+    return web.Response(body=REGISTRY.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+
+@web.middleware
+async def _count_requests(request, handler):
+    """
+    Counts the scoring requests in progress and the failed ones.
+    """
+    if request.path not in ('/score', '/score/batch'):
+        return await handler(request)
+    in_flight = IN_FLIGHT.labels()
+    in_flight.inc()
+    try:
+        return await handler(request)
+    except Exception:
+        REQUEST_ERRORS.labels(request.path).inc()
+        raise
+    finally:
+        in_flight.dec()
+
+
+async def _close_batchers(app):
+    for batcher in (app['batchers'] or {}).values():
+        await batcher.close()
+
+
+def create_app(registry, batch_window_ms=BATCH_WINDOW_MS):
+    """
+    Creates the scoring application serving the models of the given `ModelRegistry`, micro-batching the single URL
+    requests within `batch_window_ms` milliseconds (0 to score each one on its own).
+    """
+    app = web.Application(middlewares=[_count_requests])
+    app['registry'] = registry
+    app['batchers'] = {} if batch_window_ms > 0 else None
+    app.on_cleanup.append(_close_batchers)
+    app.add_routes([web.post('/score', score),
+                    web.post('/score/batch', score_batch),
+                    web.get('/healthz', health),
+                    web.get('/metrics', metrics)])
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(get_registry()), port=int(os.environ.get('PORT', '8080')))
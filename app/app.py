@@ -1,8 +1,11 @@
 import streamlit as st
-import joblib
-import pandas as pd
 import base64
-from url_utilities.url import *
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from url_utilities.batching import QueueFull
+from url_utilities.metrics import STARTUP_SECONDS, start_metrics_server
+from url_utilities.profiling import sampled
 
 image_urls = [
     "images/logo.png",
@@ -10,55 +13,109 @@ image_urls = [
     "images/red_logo.png"
 ]
 
-with open("models_stats/Naive Bayes/cr_nb.txt", "r") as file:
-    cr_nb = file.read()
+# Classification reports of the models, by the name shown in the model selection box.
+report_paths = {'Random Forest': "models_stats/Random Forest/cr_rf.txt",
+                'Naive-Bayes': "models_stats/Naive Bayes/cr_nb.txt",
+                'Stochastic Gradient Descent': "models_stats/Stochastic Gradient Descent/cr_sgd.txt"}
 
-with open("models_stats/Random Forest/cr_rf.txt", "r") as file:
-    cr_rf = file.read()
+# Short names of the models in the registry, by the name shown in the model selection box.
+models = {'Random Forest': 'rf', 'Stochastic Gradient Descent': 'sgd', 'Naive-Bayes': 'nb'}
 
-with open("models_stats/Stochastic Gradient Descent/cr_sgd.txt", "r") as file:
-    cr_sgd = file.read()
+current_image_index = 0
 
-stats = {'Random Forest': {'Classification Report': cr_rf},
-         'Naive-Bayes': {'Classification Report':  cr_nb},
-         'Stochastic Gradient Descent': {'Classification Report':  cr_sgd}}
 
-current_image_index = 0
+@st.cache_resource
+def startup():
+    # Times of the startup phases of the process, measured from its first run of the page.
+    return {'start': time.perf_counter(), 'phases': {}}
+
+
+def record_phase(timings, phase):
+    if phase not in timings['phases']:
+        seconds = time.perf_counter() - timings['start']
+        timings['phases'][phase] = seconds
+        STARTUP_SECONDS.labels(phase).set(seconds)
+        print(f"Startup: {phase} after {seconds:.3f}s", flush=True)
+
+
+def _load_registry(timings):
+    # scikit-learn, joblib and the models are only imported here, so the first page does not wait for them.
+    from url_utilities.batching import BATCH_WINDOW_MS, BackgroundBatching
+    from url_utilities.scoring import CASCADE_CONFIG_PATH, get_registry
+    record_phase(timings, 'imports')
+    registry = get_registry()
+    # The cascade is only offered when its calibration file was deployed with the models.
+    cascade_report = None
+    if 'cascade' in registry:
+        with open(CASCADE_CONFIG_PATH) as cascade_file:
+            calibration = json.load(cascade_file)
+        cascade_report = format_report(
+            f"weighted f1 {calibration['f1']:.4f} (target {calibration['target_f1']:.4f})\n"
+            f"{calibration['accepted_fraction']:.1%} of the test URLs answered by {calibration['first']}, "
+            f"the others by {calibration['fallback']}")
+    # The detections of concurrent sessions share micro-batches, unless SECURL_BATCH_WINDOW_MS is 0.
+    if BATCH_WINDOW_MS > 0:
+        score = BackgroundBatching(registry.scorers).score
+    else:
+        def score(name, url):
+            return registry.scorer(name).score(url)
+    record_phase(timings, 'registry')
+    return registry, cascade_report, score
+
+
+@st.cache_resource
+def load_registry():
+    # Shared as-is by every session of the process: the scaler and the models are loaded once, in the background
+    # while the first page renders, and never copied.
+    # Streamlit cannot serve the metrics on its own port, so they are served on SECURL_METRICS_PORT.
+    start_metrics_server()
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='registry').submit(_load_registry, startup())
+
+
+def format_report(report):
+    lines = report.split("\n")
+    formatted_string = "```\n"
+    formatted_string += "Classification Report\n\n\n"
+    for line in lines:
+        if line.startswith('precision') or line.startswith('accuracy'):
+            formatted_string += f"# {line}\n"
+        else:
+            formatted_string += f"  {line}\n"
+    formatted_string += "\n"
+    formatted_string += "```"
+    return formatted_string
+
+
+@st.cache_data
+def load_reports():
+    reports = {}
+    for name, path in report_paths.items():
+        with open(path, "r") as file:
+            reports[name] = format_report(file.read())
+    return reports
+
+
+@st.cache_data
+def load_image(path):
+    with open(path, "rb") as file:
+        return file.read()
 
 
 @st.cache_data
-def load(scaler_path, model_path):
-    sc = joblib.load(scaler_path)
-    model = joblib.load(model_path)
-    return sc, model
-
-
-def get_features(url):
-    row = []
-    char = ['@', '?', '-', '=', '.', '#', '%', '+', '$', '!', '*', ',', '//']
-    row.append(len(url))
-    for c in char:
-        row.append(url.count(c))
-    row.append(abnormal_url(url))
-    row.append(http_secure(url))
-    row.append(digit_count(url))
-    row.append(letter_count(url))
-    row.append(shortening_service(url))
-    row.append(ip_address(url))
-    return row
+def linkedin_badge(profile_url):
+    return """<a href="{}">
+            <img src="data:image/png;base64,{}" width="100">
+            </a>""".format(profile_url, base64.b64encode(load_image("images/linkedin.png")).decode())
 
 
 def change_image(index):
     global current_image_index
     current_image_index = index
-    image_container.image(image_urls[current_image_index])
+    image_container.image(load_image(image_urls[current_image_index]))
 
 
-def inference(row, scaler, model, feat_cols):
-    df = pd.DataFrame([row], columns=feat_cols)
-    X = scaler.transform(df)
-    features = pd.DataFrame(X)
-    prediction = model.predict(features)
+def inference(url, model, score):
+    prediction = score(model, url)['class_id']
     if prediction == 0:
         change_image(1)
         return "This is a benign URL ✅"
@@ -71,6 +128,9 @@ def inference(row, scaler, model, feat_cols):
     elif prediction == 3:
         change_image(2)
         return "This is a malware URL 🦠"
+    else:
+        change_image(2)
+        return "This URL could not be analysed safely ❌"
 
 
 st.set_page_config(
@@ -79,6 +139,18 @@ st.set_page_config(
     layout="centered",
     initial_sidebar_state="collapsed"
 )
+timings = startup()
+registry_future = load_registry()
+# The state of the loading is read once, as the background thread may finish it during the run.
+registry_loaded = registry_future.done()
+registry_error = registry_future.exception() if registry_loaded else None
+reports = load_reports()
+
+# Once the registry is loaded, the cascade is offered if it was deployed with the models.
+if registry_loaded and registry_error is None and registry_future.result()[1] is not None:
+    models['Cascade'] = 'cascade'
+    reports = {**reports, 'Cascade': registry_future.result()[1]}
+
 st.markdown(
     """
     <style>
@@ -90,7 +162,7 @@ st.markdown(
     unsafe_allow_html=True,
 )
 image_container = st.empty()
-image_container.image(image_urls[current_image_index])
+image_container.image(load_image(image_urls[current_image_index]))
 st.markdown("""
 ## Welcome to Malicious URL Detection
 
@@ -112,52 +184,32 @@ with st.sidebar.expander("Advanced technologies"):
 with st.sidebar.expander("Advanced options"):
     m = st.selectbox(
         'Select the model',
-        ('Random Forest', 'Stochastic Gradient Descent', 'Naive-Bayes'))
-
-
-lines = stats[m]['Classification Report'].split("\n")
-formatted_string = "```\n"
-formatted_string += "Classification Report\n\n\n"
-for line in lines:
-    if line.startswith('precision') or line.startswith('accuracy'):
-        formatted_string += f"# {line}\n"
-    else:
-        formatted_string += f"  {line}\n"
-formatted_string += "\n"
-formatted_string += "```"
+        tuple(models))
 
 with st.sidebar.expander("Statistics"):
     # st.write("Classification Report")
-    st.markdown(formatted_string, unsafe_allow_html=True)
+    st.markdown(reports[m], unsafe_allow_html=True)
 
 with st.sidebar.expander("About Us"):
     prg, rl = st.columns(2)
     with prg:
         st.write("<span style='font-size: 20px;'><b>Rocco Pizzulo</b></span>", unsafe_allow_html=True)
-        st.image("images/prg.jpeg")
+        st.image(load_image("images/prg.jpeg"))
         st.write("<span style='font-size: 13px;'><b>Computer Engineer</b></span>", unsafe_allow_html=True)
         # st.image("images/linkedin.png", width=90)
         st.markdown(
-            """<a href="https://www.linkedin.com/in/rocco-gerardo-pizzulo-718659241/">
-            <img src="data:image/png;base64,{}" width="100">
-            </a>""".format(
-                base64.b64encode(open("images/linkedin.png", "rb").read()).decode()
-            ),
+            linkedin_badge("https://www.linkedin.com/in/rocco-gerardo-pizzulo-718659241/"),
             unsafe_allow_html=True,
         )
         st.markdown("")
 
     with rl:
         st.write("<span style='font-size: 20px;'><b>Luigi Russo</b></span>", unsafe_allow_html=True)
-        st.image("images/rl.jpeg")
+        st.image(load_image("images/rl.jpeg"))
         st.write("<span style='font-size: 13px;'><b>Computer Engineer</b></span>", unsafe_allow_html=True)
         # st.image("images/linkedin.png", width=90)
         st.markdown(
-            """<a href="https://www.linkedin.com/in/luiigirusso/">
-            <img src="data:image/png;base64,{}" width="100">
-            </a>""".format(
-                base64.b64encode(open("images/linkedin.png", "rb").read()).decode()
-            ),
+            linkedin_badge("https://www.linkedin.com/in/luiigirusso/"),
             unsafe_allow_html=True,
         )
         st.markdown("")
@@ -170,14 +222,24 @@ else:
 
 if detect_button:
     with st.spinner("Detecting..."):
-        feat_cols = ['url_len', '@', '?', '-', '=', '.', '#', '%', '+', '$', '!', '*', ',', '//', 'abnormal_url', 'https', 'digits', 'letters', 'shortening_service', 'ip_address']
-        if m == 'Random Forest':
-            model_path = 'models/rf.joblib'
-        elif m == 'Stochastic Gradient Descent':
-            model_path = 'models/sgd.joblib'
-        elif m == 'Naive-Bayes':
-            model_path = 'models/nb.joblib'
-        sc, model = load('models/scaler.joblib', model_path)
-        r = get_features(url)
-        result = inference(r, sc, model, feat_cols)
-        st.markdown(f"### {result}")
+        if registry_error is None:
+            registry_error = registry_future.exception()
+        if registry_error is None:
+            # A fraction SECURL_PROFILE_SAMPLE_RATE of the detections is profiled when SECURL_PROFILE is set.
+            score = registry_future.result()[2]
+            try:
+                with sampled('app'):
+                    result = inference(url, models[m], score)
+            except QueueFull:
+                # Too many detections of the sessions are already waiting for the model.
+                st.warning("The service is busy. Please try again in a moment.")
+            else:
+                st.markdown(f"### {result}")
+
+if registry_error is not None:
+    # The failed loading is forgotten, so the next run of the page loads the models again instead of failing forever.
+    load_registry.clear()
+    print(f"Loading the models failed: {registry_error!r}", flush=True)
+    st.error("The models could not be loaded. Please try again in a moment.")
+
+record_phase(timings, 'first_render')
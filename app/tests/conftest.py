@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.preprocessing import StandardScaler
+
+# The modules of the app are imported as `url_utilities.*`, as when running from the `app` directory.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from url_utilities.cache import canonicalize  # noqa: E402
+from url_utilities.url import FEATURE_COLUMNS, extract_features  # noqa: E402
+
+
+def training_urls(count=100):
+    """
+    Returns a deterministic labelled set of URLs of the four categories, as (url, class id) pairs.
+    """
+    urls = []
+    for i in range(count):
+        urls.append((f'www.example{i}.com/articles/{i}/index.html', 0))
+        urls.append((f'http://site{i}.org/index.php?option=com_content&view=article&id={i}', 1))
+        urls.append((f'paypal-login{i}.secure-update.com/signin?user={i}&token=a{i}b', 2))
+        urls.append((f'http://192.168.{i % 255}.{i % 7 + 1}/bin/payload{i}.exe', 3))
+    return urls
+
+
+@pytest.fixture(scope='session')
+def fitted():
+    """
+    Returns a scaler and small models of the kinds trained by the pipeline, fitted on `training_urls`.
+    """
+    urls = training_urls()
+    features = np.array([extract_features(canonicalize(url)) for url, _ in urls], dtype=np.float64)
+    labels = np.array([label for _, label in urls])
+    # Like `load_data`, the scaler is fitted on a DataFrame of the named feature columns.
+    scaler = StandardScaler().fit(pd.DataFrame(features, columns=FEATURE_COLUMNS))
+    x = scaler.transform(pd.DataFrame(features, columns=FEATURE_COLUMNS))
+    models = {
+        'rf': RandomForestClassifier(n_estimators=20, random_state=0).fit(x, labels),
+        'sgd': SGDClassifier(random_state=0).fit(x, labels),
+        'sgd_log': SGDClassifier(loss='log_loss', random_state=0).fit(x, labels),
+        'nb': GaussianNB().fit(x, labels),
+    }
+    return scaler, models
+
+
+@pytest.fixture(scope='session')
+def sample_urls():
+    """
+    Returns URLs to score: some of the training set, some unseen and some of unusual shapes.
+    """
+    return [url for url, _ in training_urls()[::9]] + [
+        'https://bit.ly/abc123', 'google.com', 'http://10.0.0.1:8080/admin', 'https://bücher.de/straße',
+        'http://example.com.evil.com/secure-login/paypal.com/', 'ftp://files.example.org/pub/file.tar.gz', '']
+
+
+@pytest.fixture
+def model_files(fitted, tmp_path):
+    """
+    Dumps the fitted scaler and models like the pipeline does, returning the scaler path and the model paths.
+    """
+    scaler, models = fitted
+    scaler_path = tmp_path / 'scaler.joblib'
+    joblib.dump(scaler, scaler_path)
+    model_paths = {}
+    for name in ('rf', 'sgd', 'nb'):
+        model_paths[name] = str(tmp_path / f'{name}.joblib')
+        joblib.dump(models[name], model_paths[name])
+    return str(scaler_path), model_paths
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from api import create_app
+from url_utilities.scoring import INVALID, ModelRegistry
+
+
+@pytest.fixture
+def registry(model_files):
+    scaler_path, model_paths = model_files
+    return ModelRegistry(scaler_path, model_paths, mmap_mode=None, cache_size=0, index_path=None, cascade_path=None,
+                         flat_model_paths={})
+
+
+def _post(app, path, bodies):
+    """
+    Sends the JSON `bodies` concurrently to `path` of `app`, returning the (status, JSON body) of each response.
+    """
+    async def send(client, body):
+        response = await client.post(path, json=body)
+        return response.status, await response.json() if response.status == 200 else await response.text()
+
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            return await asyncio.gather(*(send(client, body) for body in bodies))
+
+    return asyncio.run(run())
+
+
+# URLs which `urlparse` or the abnormal URL feature cannot handle.
+MALFORMED_URLS = ['http://[abc/', 'http://' + '(' * 3000 + '.com/']
+
+
+@pytest.mark.parametrize('url', MALFORMED_URLS)
+@pytest.mark.parametrize('batch_window_ms', [0, 2])
+def test_score_rejects_malformed_url(registry, batch_window_ms, url):
+    [(status, body)] = _post(create_app(registry, batch_window_ms), '/score', [{'url': url}])
+    assert status == 200
+    assert body == {'url': url, **INVALID}
+
+
+@pytest.mark.parametrize('batch_window_ms', [0, 50])
+def test_concurrent_scores_isolate_malformed_url(registry, batch_window_ms):
+    urls = [f'https://example{i}.com/page' for i in range(20)]
+    urls.insert(7, 'http://[abc/')
+    responses = _post(create_app(registry, batch_window_ms), '/score', [{'url': url} for url in urls])
+    assert [status for status, _ in responses] == [200] * len(urls)
+    assert [body['url'] for _, body in responses] == urls
+    assert [body['source'] for _, body in responses] == ['invalid' if i == 7 else 'model' for i in range(len(urls))]
+
+
+def test_score_batch_rejects_only_malformed_urls(registry):
+    urls = ['https://bit.ly/abc123', MALFORMED_URLS[0], 'google.com', MALFORMED_URLS[1]]
+    [(status, body)] = _post(create_app(registry), '/score/batch', [{'urls': urls}])
+    assert status == 200
+    assert [result['url'] for result in body['results']] == urls
+    for url, result in zip(urls, body['results']):
+        if url in MALFORMED_URLS:
+            assert result == {'url': url, **INVALID}
+        else:
+            assert result['source'] == 'model'
+
+
+def test_health_is_served_while_a_batch_is_scored(registry):
+    scorer = registry.scorer('rf')
+    release = threading.Event()
+
+    def score_batch(urls):
+        release.wait(5)
+        return [{'url': url} for url in urls]
+
+    scorer.score_batch = score_batch
+
+    async def run():
+        async with TestClient(TestServer(create_app(registry))) as client:
+            batch = asyncio.ensure_future(client.post('/score/batch', json={'urls': ['google.com']}))
+            try:
+                health = await asyncio.wait_for(client.get('/healthz'), 2)
+                assert not batch.done()
+            finally:
+                release.set()
+            return health.status, (await batch).status
+
+    assert asyncio.run(run()) == (200, 200)
+
+
+def test_unknown_model_lists_the_served_models(registry):
+    registry.scorers['cascade'] = registry.scorers['rf']
+    [(status, text)] = _post(create_app(registry), '/score', [{'url': 'google.com', 'model': 'svm'}])
+    assert status == 400
+    assert text == "Unknown model 'svm', expected one of ['cascade', 'nb', 'rf', 'sgd']"
@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from url_utilities.batching import BackgroundBatching, MicroBatcher, QueueFull
+
+
+class _Scorer:
+    """
+    Scorer failing on the URLs starting with 'bad', which makes its whole batches fail.
+    """
+
+    name = 'test'
+
+    def __init__(self):
+        self.batches = []
+
+    def score(self, url):
+        if url.startswith('bad'):
+            raise ValueError(f'Cannot score {url}')
+        return {'url': url}
+
+    def score_batch(self, urls):
+        self.batches.append(len(urls))
+        return [self.score(url) for url in urls]
+
+
+def _score_all(batcher, urls):
+    async def run():
+        try:
+            return await asyncio.gather(*(batcher.score(url) for url in urls), return_exceptions=True)
+        finally:
+            await batcher.close()
+
+    return asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_error_only_reaches_its_caller():
+    urls = [f'https://example{i}.com' for i in range(20)]
+    urls.insert(7, 'bad://[abc/')
+    results = _score_all(MicroBatcher(_Scorer(), window_ms=50), urls)
+    for url, result in zip(urls, results):
+        if url.startswith('bad'):
+            assert isinstance(result, ValueError)
+        else:
+            assert result == {'url': url}
+
+
+def test_every_url_is_scored_in_batches():
+    scorer = _Scorer()
+    urls = [f'https://example{i}.com' for i in range(2000)]
+    results = _score_all(MicroBatcher(scorer, window_ms=0.01, max_batch_size=7, max_queue_size=len(urls)), urls)
+    assert results == [{'url': url} for url in urls]
+    assert sum(scorer.batches) == len(urls)
+    assert max(scorer.batches) <= 7
+
+
+def test_full_queue_refuses_urls():
+    results = _score_all(MicroBatcher(_Scorer(), window_ms=1, max_queue_size=5), [f'u{i}' for i in range(8)])
+    assert [result for result in results if isinstance(result, QueueFull)] == results[5:]
+    assert results[:5] == [{'url': f'u{i}'} for i in range(5)]
+
+
+def test_background_batching_scores_from_several_threads():
+    scorer = _Scorer()
+    batching = BackgroundBatching({'test': scorer}, window_ms=5)
+    urls = [f'https://example{i}.com' for i in range(200)]
+    urls.insert(50, 'bad://[abc/')
+
+    def score(url):
+        try:
+            return batching.score('test', url)
+        except ValueError as error:
+            return error
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(score, urls))
+    for url, result in zip(urls, results):
+        if url.startswith('bad'):
+            assert isinstance(result, ValueError)
+        else:
+            assert result == {'url': url}
+    # The URLs of the threads share batches.
+    assert max(scorer.batches) > 1
+
+
+def test_background_batching_refuses_urls_when_full():
+    with pytest.raises(QueueFull):
+        BackgroundBatching({'test': _Scorer()}, max_queue_size=0).score('test', 'https://example.com')
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from url_utilities.forest import FlatForest, export_forest
+
+
+@pytest.mark.parametrize('params', [
+    {'n_estimators': 25, 'class_weight': 'balanced', 'max_features': 'sqrt'},
+    {'n_estimators': 10, 'max_depth': 5, 'bootstrap': False, 'max_features': 'log2'},
+])
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_flat_forest_matches_sklearn(tmp_path, params, mmap_mode):
+    rng = np.random.RandomState(0)
+    x = rng.randint(0, 20, size=(2000, 20)).astype(np.float64)
+    y = (x[:, 0] + x[:, 1] + rng.randint(0, 8, size=len(x))) % 4
+    model = RandomForestClassifier(random_state=0, **params).fit(x[:1500], y[:1500])
+    export_forest(model, tmp_path / 'rf_flat')
+    forest = FlatForest(tmp_path / 'rf_flat', mmap_mode)
+
+    # Rows whose feature values are thresholds of the first tree, which must go to the left child.
+    tree = model.estimators_[0].tree_
+    splits = np.flatnonzero(tree.feature >= 0)
+    on_threshold = x[1500:].copy()
+    for row, node in zip(on_threshold, rng.choice(splits, size=len(on_threshold))):
+        row[tree.feature[node]] = tree.threshold[node]
+
+    for rows in (x[1500:], x[:1], on_threshold):
+        np.testing.assert_array_equal(forest.predict(rows), model.predict(rows))
+        np.testing.assert_allclose(forest.predict_proba(rows), model.predict_proba(rows), rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(forest.classes_, model.classes_)
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from url_utilities.url import extract_features, extract_features_hardened
+
+# The load data component runs from its own directory, next to a copy of `url.py` and `profiling.py` in its image.
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / 'load_data'))
+sys.path.append(str(ROOT / 'app' / 'url_utilities'))
+
+import load_data  # noqa: E402
+from feature_store import FeatureStore  # noqa: E402
+
+
+@pytest.mark.parametrize('feature_mode, extract', [('default', extract_features),
+                                                   ('hardened', extract_features_hardened)])
+def test_load_data_features_match_the_app(sample_urls, feature_mode, extract):
+    matrix = load_data.extract_feature_matrix(sample_urls, load_data.feature_extractor(feature_mode))
+    np.testing.assert_array_equal(matrix, np.array([extract(url) for url in sample_urls], dtype=np.int64))
+
+
+@pytest.mark.parametrize('chunk_size', [0, 7])
+def test_feature_store_collects_the_extracted_chunks(tmp_path, sample_urls, chunk_size):
+    dataset = tmp_path / 'dataset.csv'
+    # The dataset has no empty URL, and repeats some URLs.
+    urls = [url for url in sample_urls if url]
+    urls += urls[:5]
+    pd.DataFrame({'url': urls, 'type': 'benign'}).to_csv(dataset, index=False)
+    expected = load_data._extract_dataset(str(dataset))
+
+    def extract(store):
+        return load_data._extract_dataset(str(dataset), chunk_size, store=store,
+                                          features_path=tmp_path / load_data.FEATURES_SCRATCH_FILE)
+
+    store = FeatureStore(tmp_path / 'store', load_data.feature_schema(), len(load_data.FEATURE_COLUMNS)).open()
+    for _ in range(2):
+        for array, expected_array in zip(extract(store), expected):
+            np.testing.assert_array_equal(array, expected_array)
+    # The first run added its features as a single segment, which the second run read back.
+    assert len(store) == len(set(expected[2]))
+    assert len(store._read_manifest()) == 1
+    assert [path.name for path in store.directory.iterdir() if path.suffix != '.npy'] == ['manifest.json']
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from url_utilities.cache import canonicalize
+from url_utilities.scoring import INVALID, LABELS, Scorer
+from url_utilities.url import FEATURE_COLUMNS, extract_features
+
+# URLs which `urlparse` or the abnormal URL feature cannot handle.
+MALFORMED_URLS = ['http://[abc/', 'https://[::1/path', 'http://a(b/c', 'http://' + '(' * 3000 + '.com/']
+
+
+@pytest.mark.parametrize('url', MALFORMED_URLS)
+def test_score_rejects_malformed_url(fitted, url):
+    scaler, models = fitted
+    assert Scorer(scaler, models['rf'], 'rf').score(url) == {'url': url, **INVALID}
+
+
+def test_score_batch_isolates_malformed_urls(fitted):
+    scaler, models = fitted
+    scorer = Scorer(scaler, models['rf'], 'rf')
+    urls = ['https://bit.ly/abc123', MALFORMED_URLS[0], 'www.example1.com/articles/1/index.html'] + MALFORMED_URLS[1:]
+    results = scorer.score_batch(urls)
+    assert [result['url'] for result in results] == urls
+    for url, result in zip(urls, results):
+        if url in MALFORMED_URLS:
+            assert result == {'url': url, **INVALID}
+        else:
+            assert result == scorer.score(url)
+
+
+def _dataframe_inference(scaler, model, url):
+    """
+    Class id and probabilities of a URL through the original inference path of the page, with DataFrames.
+    """
+    df = pd.DataFrame([extract_features(canonicalize(url))], columns=FEATURE_COLUMNS)
+    features = pd.DataFrame(scaler.transform(df))
+    proba = model.predict_proba(features)[0] if hasattr(model, 'predict_proba') else None
+    return int(model.predict(features)[0]), proba
+
+
+@pytest.mark.parametrize('name', ['rf', 'sgd', 'sgd_log', 'nb'])
+def test_scorer_matches_dataframe_inference(fitted, sample_urls, name):
+    scaler, models = fitted
+    model = models[name]
+    scorer = Scorer(scaler, model, name)
+    batch = scorer.score_batch(sample_urls)
+    for url, batch_result in zip(sample_urls, batch):
+        class_id, proba = _dataframe_inference(scaler, model, url)
+        for result in (scorer.score(url), batch_result):
+            assert result['class_id'] == class_id
+            assert result['label'] == LABELS[class_id]
+            if proba is None:
+                assert result['probabilities'] is None
+            else:
+                probabilities = [result['probabilities'][LABELS[c]] for c in model.classes_]
+                np.testing.assert_allclose(probabilities, proba, rtol=1e-12, atol=1e-12)
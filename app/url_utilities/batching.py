@@ -0,0 +1,197 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from url_utilities.metrics import BATCH_SIZES, QUEUE_DEPTH, QUEUE_REJECTED, QUEUE_WAIT_SECONDS
+from url_utilities.profiling import sampled
+
+# Longest time the first URL of a batch waits for others, in milliseconds (0 disables the micro-batching), largest
+# number of URLs of a batch and largest number of URLs waiting for a batch, beyond which new ones are refused.
+BATCH_WINDOW_MS = float(os.environ.get('SECURL_BATCH_WINDOW_MS', '2'))
+BATCH_MAX_SIZE = int(os.environ.get('SECURL_BATCH_MAX_SIZE', '64'))
+BATCH_QUEUE_SIZE = int(os.environ.get('SECURL_BATCH_QUEUE_SIZE', '1000'))
+
+
+class QueueFull(Exception):
+    """
+    Raised when a URL is submitted to a `MicroBatcher` whose queue is full.
+    """
+
+
+class MicroBatcher:
+    """
+    Groups the single URLs submitted concurrently to a `Scorer` into batches scored with one call to the model.
+
+    A batch starts with the oldest waiting URL and takes the URLs submitted within `window_ms` milliseconds, up to
+    `max_batch_size`; it is scored by `Scorer.score_batch` in a worker thread, so the event loop keeps accepting
+    requests meanwhile, and the URLs submitted during that time form the next batch. Each caller gets the same result
+    as `Scorer.score`. If the batch fails as a whole, its URLs are scored one by one, so that an error only reaches the
+    caller of the URL which caused it. At most `max_queue_size` URLs wait at a time: beyond that `score` raises
+    `QueueFull` at once rather than letting the latency grow without bound.
+
+    The batcher belongs to the event loop of its first `score` call. The depth of the queue, the waiting time of the
+    URLs, the size of the batches and the refused URLs are recorded in the metrics of `url_utilities.metrics`, and a
+    fraction of the batches is profiled when SECURL_PROFILE is set (see `url_utilities.profiling`).
+
+    Args:
+        - scorer (Scorer): The scorer of the model.
+        - window_ms (float): Longest time the first URL of a batch waits for others, in milliseconds.
+        - max_batch_size (int): Largest number of URLs of a batch.
+        - max_queue_size (int): Largest number of URLs waiting for a batch.
+
+    Example:
+        >>> batcher = MicroBatcher(registry.scorer('rf'), window_ms=2)
+        >>> await batcher.score("https://bit.ly/abc123")
+        {'url': 'https://bit.ly/abc123', 'class_id': 2, 'label': 'phishing', 'probabilities': {...},
+         'source': 'model'}
+    """
+
+    def __init__(self, scorer, window_ms=BATCH_WINDOW_MS, max_batch_size=BATCH_MAX_SIZE,
+                 max_queue_size=BATCH_QUEUE_SIZE):
+        self.scorer = scorer
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        # The waiting URLs stay in the deque until a batch takes them: the worker only waits on `_arrived`, so a
+        # timeout can never drop a URL already taken from the queue.
+        self._queue = deque()
+        self._arrived = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'batcher-{scorer.name}')
+        self._worker = None
+        self._depth = QUEUE_DEPTH.labels(scorer.name)
+        self._waits = QUEUE_WAIT_SECONDS.labels(scorer.name)
+        self._sizes = BATCH_SIZES.labels(scorer.name)
+        self._rejected = QUEUE_REJECTED.labels(scorer.name)
+
+    async def score(self, url):
+        """
+        Classifies a single URL as part of the next batch, see `Scorer.score`.
+        """
+        loop = asyncio.get_running_loop()
+        if self._worker is None:
+            self._worker = loop.create_task(self._run())
+        if len(self._queue) >= self.max_queue_size:
+            self._rejected.inc()
+            raise QueueFull(f'{self.max_queue_size} URLs are already waiting for model {self.scorer.name}')
+        future = loop.create_future()
+        self._queue.append((url, future, time.perf_counter()))
+        self._arrived.set()
+        self._depth.set(len(self._queue))
+        return await future
+
+    async def _wait_for_url(self, timeout=None):
+        """
+        Waits until a URL is waiting in the queue, or for at most `timeout` seconds.
+        """
+        if self._queue:
+            return
+        self._arrived.clear()
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _next_batch(self):
+        """
+        Waits for the first URL of a batch, then for the others until the window closes or the batch is full.
+        """
+        loop = asyncio.get_running_loop()
+        while not self._queue:
+            await self._wait_for_url()
+        batch = [self._queue.popleft()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            if self._queue:
+                batch.append(self._queue.popleft())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            await self._wait_for_url(timeout)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            self._depth.set(len(self._queue))
+            start = time.perf_counter()
+            for _, _, submitted in batch:
+                self._waits.observe(start - submitted)
+            self._sizes.observe(len(batch))
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._score_batch, [url for url, _, _ in batch])
+            except Exception as error:
+                outcomes = [(None, error)] * len(batch)
+            # Callers which gave up (e.g. a closed connection) have their future cancelled already.
+            for (_, future, _), (result, error) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def _score_batch(self, urls):
+        """
+        Scores the URLs of a batch, returning a (result, exception) pair per URL. If the batch fails as a whole, the
+        URLs are scored one by one to find the ones which fail.
+        """
+        with sampled(f'batch-{self.scorer.name}'):
+            try:
+                return [(result, None) for result in self.scorer.score_batch(urls)]
+            except Exception:
+                pass
+            outcomes = []
+            for url in urls:
+                try:
+                    outcomes.append((self.scorer.score(url), None))
+                except Exception as error:
+                    outcomes.append((None, error))
+            return outcomes
+
+    async def close(self):
+        """
+        Stops the worker of the batcher; URLs still waiting are not scored.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+
+class BackgroundBatching:
+    """
+    Runs a `MicroBatcher` per scorer on an event loop of its own thread, for callers outside asyncio such as the
+    sessions of the Streamlit page, which each run in their own thread.
+
+    Args:
+        - scorers (dict): The scorers by model name, e.g. `ModelRegistry.scorers`.
+        - window_ms (float): See `MicroBatcher`.
+        - max_batch_size (int): See `MicroBatcher`.
+        - max_queue_size (int): See `MicroBatcher`.
+
+    Example:
+        >>> BackgroundBatching(registry.scorers).score('rf', "https://bit.ly/abc123")
+        {'url': 'https://bit.ly/abc123', 'class_id': 2, 'label': 'phishing', 'probabilities': {...},
+         'source': 'model'}
+    """
+
+    def __init__(self, scorers, window_ms=BATCH_WINDOW_MS, max_batch_size=BATCH_MAX_SIZE,
+                 max_queue_size=BATCH_QUEUE_SIZE):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='batching', daemon=True).start()
+        self.batchers = {name: MicroBatcher(scorer, window_ms, max_batch_size, max_queue_size)
+                         for name, scorer in scorers.items()}
+
+    def score(self, name, url):
+        """
+        Classifies a single URL with the model called `name`, blocking the calling thread until its batch is scored.
+        Raises `QueueFull` in the calling thread when too many URLs are already waiting for the model.
+        """
+        return asyncio.run_coroutine_threadsafe(self.batchers[name].score(url), self.loop).result()
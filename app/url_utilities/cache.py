@@ -0,0 +1,90 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# `load_data` removes every match of the 'www.' pattern from the URLs before extracting their features.
+_WWW_RE = re.compile('www.')
+
+
+def canonicalize(url):
+    """
+    Normalizes a URL the same way the training set is normalized by `load_data`.
+
+    Args:
+        - url (str): The URL to normalize.
+
+    Returns:
+        - str: The URL without the 'www.' prefixes.
+
+    Example:
+        >>> canonicalize("https://www.example.com/path/to/page")
+        'https://example.com/path/to/page'
+    """
+    return _WWW_RE.sub('', url)
+
+
+class VerdictCache:
+    """
+    Bounded LRU cache of the verdicts of the models, keyed by model name and canonical URL.
+
+    Entries expire after the time-to-live of their model and the least recently used entry is evicted when the cache
+    is full. The cache is safe to share between threads.
+
+    Args:
+        - max_size (int): Largest number of entries kept in the cache.
+        - ttl (float): Default time-to-live of the entries, in seconds.
+        - model_ttl (dict or None): Time-to-live by model name, overriding `ttl`.
+    """
+
+    def __init__(self, max_size=100000, ttl=3600.0, model_ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model_ttl = dict(model_ttl or {})
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, model, url):
+        """
+        Returns the cached verdict of `model` for the canonical `url`, or None if it is missing or expired.
+        """
+        key = (model, url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model, url, verdict):
+        """
+        Stores the verdict of `model` for the canonical `url`, evicting the least recently used entries if needed.
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.model_ttl.get(model, self.ttl)
+        key = (model, url)
+        with self._lock:
+            self._entries[key] = (expires_at, verdict)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Returns the number of entries and the hit, miss and eviction counters of the cache.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,211 @@
+import argparse
+import json
+from pathlib import Path
+import joblib
+import numpy as np
+from sklearn.utils.metaestimators import available_if
+
+CASCADE_PATH = 'models/cascade.json'
+
+# Number of candidate thresholds per class tried by the calibration, taken at evenly spaced quantiles of the
+# confidences of the rows predicted in that class.
+CALIBRATION_QUANTILES = 50
+
+# Number of passes of the calibration over the classes.
+CALIBRATION_PASSES = 3
+
+
+def confidence(model, x):
+    """
+    Returns the predicted class ids of the rows of `x` and the confidence of the model in them.
+
+    The confidence is the largest class probability for models which provide them, otherwise the largest value of
+    the decision function (e.g. for an SGD classifier trained with the hinge loss).
+
+    Args:
+        - model: The classification model.
+        - x (numpy.ndarray): The scaled feature rows.
+
+    Returns:
+        - tuple: The class ids and their confidences.
+    """
+    scores = model.predict_proba(x) if hasattr(model, 'predict_proba') else model.decision_function(x)
+    best = np.argmax(scores, axis=1)
+    return model.classes_.take(best), scores[np.arange(len(best)), best]
+
+
+class CascadeModel:
+    """
+    Classifies rows with a cheap model first and only sends the uncertain ones to a more expensive model.
+
+    A prediction of the first model is accepted when its confidence (see `confidence`) is at least the threshold of
+    its class, calibrated on the test set by `calibrate`; the other rows are predicted by the fallback model, usually
+    the random forest. The model has the `classes_`, `predict` and, when the first model provides probabilities,
+    `predict_proba` of a scikit-learn classifier, so it can be used by a `Scorer` like the other models.
+
+    Args:
+        - first: The cheap model, e.g. the Naive-Bayes or SGD classifier.
+        - fallback: The model of the uncertain rows, e.g. the random forest.
+        - thresholds (dict): Smallest confidence of the first model accepted for each class id.
+
+    Example:
+        >>> CascadeModel(nb, rf, {0: 0.98, 1: 0.99, 2: 1.0, 3: 0.97}).predict(features)
+        array([0, 2])
+    """
+
+    def __init__(self, first, fallback, thresholds):
+        if not np.array_equal(first.classes_, fallback.classes_):
+            raise ValueError('The models of a cascade must predict the same classes')
+        self.first = first
+        self.fallback = fallback
+        self.classes_ = first.classes_
+        lookup = {int(c): float(t) for c, t in thresholds.items()}
+        self.thresholds = np.array([lookup.get(int(c), np.inf) for c in self.classes_])
+
+    def _accepted(self, x):
+        class_ids, confidences = confidence(self.first, x)
+        accepted = confidences >= self.thresholds[np.searchsorted(self.classes_, class_ids)]
+        return class_ids, accepted
+
+    def predict(self, x):
+        """
+        Returns the predicted classes of the rows of `x`.
+        """
+        class_ids, accepted = self._accepted(x)
+        if not accepted.all():
+            class_ids = class_ids.copy()
+            class_ids[~accepted] = self.fallback.predict(x[~accepted])
+        return class_ids
+
+    def _has_proba(self):
+        return hasattr(self.first, 'predict_proba') and hasattr(self.fallback, 'predict_proba')
+
+    @available_if(_has_proba)
+    def predict_proba(self, x):
+        """
+        Returns the class probabilities of the rows of `x`, given by the model which predicted each row.
+        """
+        proba = self.first.predict_proba(x)
+        accepted = proba.max(axis=1) >= self.thresholds[np.argmax(proba, axis=1)]
+        if not accepted.all():
+            proba[~accepted] = self.fallback.predict_proba(x[~accepted])
+        return proba
+
+
+def load_cascade(models, path=CASCADE_PATH):
+    """
+    Builds the `CascadeModel` described by a calibration file from the loaded models.
+
+    Args:
+        - models (dict): The loaded models by name.
+        - path (str): Calibration file written by `calibrate`.
+
+    Returns:
+        - CascadeModel: The cascade of the models named in the file.
+    """
+    with open(path) as cascade_file:
+        config = json.load(cascade_file)
+    return CascadeModel(models[config['first']], models[config['fallback']], config['thresholds'])
+
+
+def _weighted_f1(y_true, y_pred, n_classes):
+    """
+    Computes the support-weighted F1-score from the confusion matrix, like `f1_score(average='weighted')`.
+    """
+    matrix = np.bincount(y_true * n_classes + y_pred, minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+    true_positives = np.diag(matrix).astype(np.float64)
+    support = matrix.sum(axis=1)
+    denominator = support + matrix.sum(axis=0)
+    f1 = np.divide(2 * true_positives, denominator, out=np.zeros(n_classes), where=denominator > 0)
+    return float(np.dot(f1, support) / support.sum())
+
+
+def calibrate(first, fallback, x, y, target_f1):
+    """
+    Chooses the thresholds of a cascade which send the fewest rows to the fallback model while keeping its weighted
+    F1-score on `x` at least `target_f1`.
+
+    Starting from thresholds which send every row to the fallback model, each pass lowers the threshold of each class
+    in turn to the smallest candidate which still meets the target, given the thresholds of the other classes.
+
+    Args:
+        - first: The cheap model.
+        - fallback: The model of the uncertain rows.
+        - x (numpy.ndarray): Scaled feature rows held out from the training, e.g. the test set.
+        - y (numpy.ndarray): Their class ids.
+        - target_f1 (float): Smallest weighted F1-score of the cascade.
+
+    Returns:
+        - dict: The thresholds by class id, the F1-scores of the cascade and of each model and the fraction of the
+          rows accepted from the first model.
+    """
+    classes = first.classes_
+    n_classes = len(classes)
+    y = np.searchsorted(classes, y)
+    first_pred, confidences = confidence(first, x)
+    first_pred = np.searchsorted(classes, first_pred)
+    fallback_pred = np.searchsorted(classes, fallback.predict(x))
+
+    candidates = []
+    for c in range(n_classes):
+        values = confidences[first_pred == c]
+        quantiles = np.quantile(values, np.linspace(0, 1, CALIBRATION_QUANTILES + 1)) if len(values) else []
+        candidates.append(np.unique(quantiles))
+
+    thresholds = np.full(n_classes, np.inf)
+
+    def cascade_f1(thresholds):
+        accepted = confidences >= thresholds[first_pred]
+        return _weighted_f1(y, np.where(accepted, first_pred, fallback_pred), n_classes)
+
+    for _ in range(CALIBRATION_PASSES):
+        for c in range(n_classes):
+            for candidate in candidates[c]:
+                if candidate >= thresholds[c]:
+                    break
+                trial = thresholds.copy()
+                trial[c] = candidate
+                if cascade_f1(trial) >= target_f1:
+                    thresholds = trial
+                    break
+
+    accepted = confidences >= thresholds[first_pred]
+    return {'thresholds': {int(c): float(t) for c, t in zip(classes, thresholds) if np.isfinite(t)},
+            'target_f1': target_f1, 'f1': cascade_f1(thresholds),
+            'first_f1': _weighted_f1(y, first_pred, n_classes),
+            'fallback_f1': _weighted_f1(y, fallback_pred, n_classes), 'accepted_fraction': float(accepted.mean())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrates the thresholds of the cascade of a cheap model and the '
+                                                 'random forest on the test set of the dataset.')
+    parser.add_argument('--data', type=str, required=True, help='Dataset directory written by load_data.')
+    parser.add_argument('--first', type=str, default='models/nb.joblib', help='Dump of the cheap model.')
+    parser.add_argument('--first-name', type=str, default='nb', help='Name of the cheap model in the registry.')
+    parser.add_argument('--fallback', type=str, default='models/rf.joblib', help='Dump of the fallback model.')
+    parser.add_argument('--fallback-name', type=str, default='rf', help='Name of the fallback model in the registry.')
+    parser.add_argument('--target-f1', type=float, default=None,
+                        help='Smallest weighted F1-score of the cascade, by default the one of the fallback model '
+                             'minus the tolerance.')
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help='Largest loss of weighted F1-score from the fallback model when no target is given.')
+    parser.add_argument('--output', type=str, default=CASCADE_PATH, help='Path of the calibration file.')
+    args = parser.parse_args()
+
+    directory = Path(args.data)
+    with open(directory / 'manifest.json') as manifest_file:
+        manifest = json.load(manifest_file)
+    x_test = np.asarray(np.load(directory / manifest['arrays']['x_test']['file'], mmap_mode='r'), dtype=np.float64)
+    y_test = np.load(directory / manifest['arrays']['y_test']['file'])
+
+    first, fallback = joblib.load(args.first), joblib.load(args.fallback)
+    target_f1 = args.target_f1
+    if target_f1 is None:
+        target_f1 = _weighted_f1(np.searchsorted(fallback.classes_, y_test),
+                                 np.searchsorted(fallback.classes_, fallback.predict(x_test)),
+                                 len(fallback.classes_)) - args.tolerance
+    result = calibrate(first, fallback, x_test, y_test, target_f1)
+    result.update({'first': args.first_name, 'fallback': args.fallback_name})
+    with open(args.output, 'w') as cascade_file:
+        json.dump(result, cascade_file, indent=2)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,77 @@
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+from url_utilities.url import process_tld
+
+INDEX_PATH = 'models/known_index'
+
+
+def url_hash(text):
+    """
+    Returns the 64-bit BLAKE2b hash of a string, the key of the known URL index (see `load_data.url_hash`).
+
+    Args:
+        - text (str): The canonical URL or the domain to hash.
+
+    Returns:
+        - int: The hash, as an unsigned 64-bit integer.
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+
+
+class KnownIndex:
+    """
+    Exact-match index of the labelled URLs and domains of the training set, written by `load_data --index`.
+
+    The index is made of sorted arrays of 64-bit hashes, memory-mapped read-only and searched with a binary search.
+    Domains are only used if `domain_min_count` is set, and then only for the domains labelled at least that many
+    times, always with the same label.
+
+    Args:
+        - path (str): Directory of the index.
+        - domain_min_count (int): Smallest number of labelled rows of a domain for its label to be used, 0 to only
+          look up full URLs.
+    """
+
+    def __init__(self, path=INDEX_PATH, domain_min_count=0):
+        directory = Path(path)
+        with open(directory / 'manifest.json') as manifest_file:
+            manifest = json.load(manifest_file)
+        arrays = {name: np.load(directory / entry['file'], mmap_mode='r')
+                  for name, entry in manifest['arrays'].items()}
+        self.url_hashes, self.url_labels = arrays['url_hashes'], arrays['url_labels']
+        self.domain_hashes, self.domain_labels = arrays['domain_hashes'], arrays['domain_labels']
+        self.domain_counts = arrays['domain_counts']
+        self.domain_min_count = domain_min_count
+
+    def __len__(self):
+        return len(self.url_hashes)
+
+    @staticmethod
+    def _search(hashes, key):
+        i = int(np.searchsorted(hashes, np.uint64(key)))
+        if i < len(hashes) and hashes[i] == key:
+            return i
+        return None
+
+    def lookup(self, url):
+        """
+        Returns the label id of a canonical URL, or None if neither the URL nor its domain is known.
+
+        Args:
+            - url (str): The canonical URL to look up.
+
+        Returns:
+            - int or None: The category id of the URL.
+        """
+        i = self._search(self.url_hashes, url_hash(url))
+        if i is not None:
+            return int(self.url_labels[i])
+        if self.domain_min_count > 0:
+            domain = process_tld(url)
+            if domain:
+                i = self._search(self.domain_hashes, url_hash(domain))
+                if i is not None and self.domain_counts[i] >= self.domain_min_count:
+                    return int(self.domain_labels[i])
+        return None
@@ -0,0 +1,267 @@
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the buckets of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# Port of the metrics server started by the Streamlit page, which cannot add routes of its own.
+METRICS_PORT = int(os.environ.get('SECURL_METRICS_PORT', '9100'))
+
+# Content type of the Prometheus text exposition format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    """
+    Base of the metrics: a family of values of the same name, one per combination of label values.
+
+    The value of a combination is created by `labels` the first time it is used and can be kept by the caller, so
+    that recording a sample on the hot path only costs a lock and an addition.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._function = None
+
+    def labels(self, *values):
+        """
+        Returns the value of the metric for the given label values, in the order of `labelnames`.
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects the labels {self.labelnames}')
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def set_function(self, function):
+        """
+        Reads the value of an unlabelled metric from `function` when the metrics are collected.
+        """
+        self._function = function
+
+    def samples(self):
+        """
+        Yields the (name, label names, label values, value) samples of the metric.
+        """
+        if self._function is not None:
+            yield self.name, (), (), self._function()
+            return
+        for values, child in sorted(self._children.items()):
+            for suffix, names, extra, value in child.samples():
+                yield self.name + suffix, self.labelnames + names, values + extra, value
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def samples(self):
+        yield '', (), (), self.value
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, e.g. of requests or URLs.
+    """
+
+    kind = 'counter'
+
+    def _child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    """
+    Value which goes up and down, e.g. the number of requests in progress.
+    """
+
+    kind = 'gauge'
+
+    def _child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', ('le',), ('+Inf' if bound == float('inf') else repr(bound),), cumulative
+        yield '_sum', (), (), total
+        yield '_count', (), (), cumulative
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. latencies, counted in cumulative buckets.
+
+    Args:
+        - name (str): Name of the metric.
+        - documentation (str): Help text of the metric.
+        - labelnames (tuple of str): Names of its labels.
+        - buckets (tuple of float): Increasing upper bounds of the buckets, without +Inf.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered together in the Prometheus text exposition format.
+
+    Example:
+        >>> registry = MetricsRegistry()
+        >>> registry.register(Counter('securl_urls_total', 'URLs classified.', ('model',))).labels('rf').inc()
+        >>> print(registry.render())
+        # HELP securl_urls_total URLs classified.
+        # TYPE securl_urls_total counter
+        securl_urls_total{model="rf"} 1.0
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Returns the current value of every metric as Prometheus text.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labelnames, values, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labelnames, values)} {float(value)!r}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Time spent by each stage of the detection path, by model: 'load' of the model, 'lookup' in the index and the
+# verdict cache, 'features' extraction, 'scale' of the feature rows and 'predict' of the model. Batches are timed
+# once per batch.
+STAGE_SECONDS = REGISTRY.register(Histogram('securl_stage_seconds', 'Time spent in each stage of the detection path.',
+                                            ('stage', 'model')))
+
+# URLs classified by model and source of their verdict: 'index', 'cache', 'model', or 'budget' and 'invalid' when
+# rejected.
+VERDICTS = REGISTRY.register(Counter('securl_verdicts_total', 'URLs classified, by model and source of the verdict.',
+                                     ('model', 'source')))
+
+# Requests of the scoring API by endpoint and model, and requests in progress.
+REQUEST_SECONDS = REGISTRY.register(Histogram('securl_request_seconds', 'Latency of the scoring API requests.',
+                                              ('endpoint', 'model')))
+REQUEST_ERRORS = REGISTRY.register(Counter('securl_request_errors_total', 'Scoring API requests which failed.',
+                                           ('endpoint',)))
+IN_FLIGHT = REGISTRY.register(Gauge('securl_inflight_requests', 'Scoring API requests in progress.'))
+
+# Verdict cache shared by the models.
+CACHE_ENTRIES = REGISTRY.register(Gauge('securl_cache_entries', 'Verdicts held by the cache.'))
+CACHE_EVICTIONS = REGISTRY.register(Counter('securl_cache_evictions_total', 'Verdicts evicted from the cache.'))
+
+# Micro-batching of the single URL requests by model: URLs waiting in the queue, time they waited, size of the batches
+# sent to the model and URLs refused because the queue was full.
+QUEUE_DEPTH = REGISTRY.register(Gauge('securl_batch_queue_depth', 'URLs waiting to be batched.', ('model',)))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram('securl_batch_queue_wait_seconds',
+                                                 'Time the URLs waited in the queue before their batch started.',
+                                                 ('model',)))
+BATCH_SIZES = REGISTRY.register(Histogram('securl_batch_size', 'Number of URLs of the micro-batches.', ('model',),
+                                          buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)))
+QUEUE_REJECTED = REGISTRY.register(Counter('securl_batch_rejected_total', 'URLs refused because the queue was full.',
+                                           ('model',)))
+
+# Time from the first run of the Streamlit page to each phase of its startup: 'first_render', 'imports' of the
+# models' libraries and 'registry' loaded.
+STARTUP_SECONDS = REGISTRY.register(Gauge('securl_startup_seconds', 'Time from the first run of the page to each '
+                                                                     'startup phase.', ('phase',)))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serves the metrics of the process on `port` from a daemon thread, once per process.
+
+    Returns:
+        - ThreadingHTTPServer: The server, or None if the port is 0 or already in use.
+    """
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            try:
+                _server = ThreadingHTTPServer(('', port), _MetricsHandler)
+            except OSError:
+                return None
+            threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        return _server
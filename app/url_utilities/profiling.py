@@ -0,0 +1,114 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# Single source of the profiling helpers of the repository: the images of the load data component and of the trainers
+# copy this file next to their scripts, which import it as `profiling`.
+
+# Profiling mode: '' (disabled), 'cpu' for cProfile, 'memory' for tracemalloc or 'all' for both.
+PROFILE_MODE = os.environ.get('SECURL_PROFILE', '')
+
+# Directory of the profiles, number of entries of their summaries and number of frames kept per allocation.
+PROFILE_DIR = os.environ.get('SECURL_PROFILE_DIR', 'profiles')
+PROFILE_TOP = int(os.environ.get('SECURL_PROFILE_TOP', '30'))
+PROFILE_FRAMES = int(os.environ.get('SECURL_PROFILE_FRAMES', '1'))
+
+# Fraction of the requests profiled by `sampled`.
+PROFILE_SAMPLE_RATE = float(os.environ.get('SECURL_PROFILE_SAMPLE_RATE', '0.01'))
+
+PROFILE_MODES = ('', 'cpu', 'memory', 'all')
+
+# Only one profile runs at a time: cProfile and tracemalloc hooks are per process.
+_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def _write_summaries(path, profiler, snapshot, peak, seconds, top):
+    """
+    Writes the cProfile dump and the top-N summaries of a profile next to `path`.
+    """
+    lines = [f'wall time: {seconds:.3f}s']
+    if profiler is not None:
+        profiler.dump_stats(f'{path}.prof')
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(top)
+        with open(f'{path}.cpu.txt', 'w') as summary_file:
+            summary_file.write(stream.getvalue())
+    if snapshot is not None:
+        lines.append(f'peak traced memory: {peak / 2 ** 20:.1f} MiB')
+        statistics = snapshot.statistics('lineno' if PROFILE_FRAMES <= 1 else 'traceback')
+        with open(f'{path}.memory.txt', 'w') as summary_file:
+            summary_file.write(f'peak traced memory: {peak / 2 ** 20:.1f} MiB\n\n')
+            for statistic in statistics[:top]:
+                summary_file.write(f'{statistic}\n')
+    print(f"Profile {path}: {', '.join(lines)}")
+
+
+@contextmanager
+def profile(name, mode=PROFILE_MODE, directory=PROFILE_DIR, top=PROFILE_TOP):
+    """
+    Profiles the enclosed block with cProfile and/or tracemalloc and writes the results in `directory`.
+
+    The files of a profile are named '<name>-<time>-<pid>-<sequence>': '.prof' is the cProfile dump (for `pstats` or
+    snakeviz), '.cpu.txt' its `top` functions by cumulative time and '.memory.txt' the `top` lines by memory
+    allocated and still held at the end of the block, with the peak of the traced memory. cProfile only sees the
+    calling thread: the work of joblib worker processes shows up as waiting time. When another profile is running,
+    the block runs without being profiled.
+
+    Args:
+        - name (str): Prefix of the files of the profile.
+        - mode (str): '' to disable profiling, 'cpu', 'memory' or 'all'.
+        - directory (str): Directory of the profiles.
+        - top (int): Number of entries of the summaries.
+
+    Example:
+        >>> with profile('random_forest', 'all', '/tmp/profiles'):
+        ...     _random_forest(args)
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profiling mode '{mode}', expected one of {PROFILE_MODES}")
+    if not mode or not _lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        path = str(Path(directory) / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_sequence)}")
+        profiler = cProfile.Profile() if mode in ('cpu', 'all') else None
+        trace_memory = mode in ('memory', 'all') and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start(PROFILE_FRAMES)
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            snapshot, peak = None, 0
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            _write_summaries(path, profiler, snapshot, peak, seconds, top)
+    finally:
+        _lock.release()
+
+
+def sampled(name, mode=PROFILE_MODE, rate=PROFILE_SAMPLE_RATE, directory=PROFILE_DIR, top=PROFILE_TOP):
+    """
+    Returns the `profile` context of the enclosed block for a random fraction `rate` of the calls, e.g. of the
+    requests of a server, and a context doing nothing for the others.
+    """
+    if mode and random.random() < rate:
+        return profile(name, mode, directory, top)
+    return nullcontext()
@@ -0,0 +1,382 @@
+import os
+import re
+import threading
+import time
+from functools import partial
+from pathlib import Path
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from url_utilities.cache import VerdictCache, canonicalize
+from url_utilities.cascade import CASCADE_PATH, CascadeModel, load_cascade
+from url_utilities.forest import FlatForest
+from url_utilities.known import INDEX_PATH, KnownIndex
+from url_utilities.metrics import CACHE_ENTRIES, CACHE_EVICTIONS, STAGE_SECONDS, VERDICTS
+from url_utilities.url import (FEATURE_COLUMNS, MAX_URL_LENGTH, FeatureBudgetExceeded, extract_features,
+                               extract_features_hardened)
+
+SCALER_PATH = 'models/scaler.joblib'
+
+# Serialized models, by the short name used to select them.
+MODEL_PATHS = {
+    'rf': 'models/rf.joblib',
+    'sgd': 'models/sgd.joblib',
+    'nb': 'models/nb.joblib',
+}
+
+# Flat exports of the random forests (see `url_utilities.forest`), loaded instead of their dumps when they exist.
+FLAT_MODEL_PATHS = {
+    'rf': os.environ.get('SECURL_RF_FLAT_PATH', 'models/rf_flat'),
+}
+
+# Calibration file of the cascade of a cheap model and the random forest (see `url_utilities.cascade`), served as
+# the 'cascade' model when it exists.
+CASCADE_CONFIG_PATH = os.environ.get('SECURL_CASCADE_PATH', CASCADE_PATH)
+
+# Names of the categories, indexed by the class id predicted by the models.
+LABELS = ['benign', 'defacement', 'phishing', 'malware']
+
+# Memory-map mode used by joblib to load the NumPy arrays of the models (empty to load them in memory). Mapping them
+# read-only lets the processes of a node share the pages of the same model files.
+MMAP_MODE = os.environ.get('SECURL_MMAP_MODE', 'r') or None
+
+# Size of the verdict cache and time-to-live of its entries, in seconds. The time-to-live of a single model can be
+# overridden with SECURL_CACHE_TTL_<NAME>, e.g. SECURL_CACHE_TTL_RF.
+CACHE_SIZE = int(os.environ.get('SECURL_CACHE_SIZE', '100000'))
+CACHE_TTL = float(os.environ.get('SECURL_CACHE_TTL', '3600'))
+
+# Index of the labelled URLs of the training set, used when it exists, and smallest number of labelled rows of a
+# domain for the index to answer for the whole domain (0 to only match full URLs).
+KNOWN_INDEX_PATH = os.environ.get('SECURL_INDEX_PATH', INDEX_PATH)
+INDEX_DOMAIN_MIN_COUNT = int(os.environ.get('SECURL_INDEX_DOMAIN_MIN_COUNT', '0'))
+
+# Feature extraction mode, which must be the one the models were trained with (`load_data --feature-mode`), length
+# at which the hardened mode truncates the URLs and CPU time budget of the hardened mode per URL, in milliseconds (0
+# for no budget).
+FEATURE_MODE = os.environ.get('SECURL_FEATURE_MODE', 'default')
+URL_LENGTH_LIMIT = int(os.environ.get('SECURL_MAX_URL_LENGTH', str(MAX_URL_LENGTH)))
+FEATURE_BUDGET_MS = float(os.environ.get('SECURL_FEATURE_BUDGET_MS', '50'))
+
+# Verdict of the URLs whose features could not be extracted within their budget: they are never reported as benign.
+REJECTED = {'class_id': None, 'label': 'rejected', 'probabilities': None, 'source': 'budget'}
+
+# Verdict of the URLs which cannot be parsed, e.g. 'http://[abc/', rejected like the ones over their budget.
+INVALID = {'class_id': None, 'label': 'rejected', 'probabilities': None, 'source': 'invalid'}
+
+# Errors of the feature extraction on malformed URLs: `urlparse` raises ValueError on URLs such as 'http://[abc/', and
+# the abnormal URL feature uses the hostname as a pattern, which may be invalid (re.error) or nest too deeply for the
+# regex parser (RecursionError), e.g. 'http://' + '(' * 3000 + '.com/'.
+INVALID_URL_ERRORS = (ValueError, re.error, RecursionError)
+
+
+def load_models(scaler_path=SCALER_PATH, model_paths=None, mmap_mode=MMAP_MODE, flat_model_paths=None):
+    """
+    Loads the fitted scaler and the classification models.
+
+    A model with an existing flat export in `flat_model_paths` is loaded as a `FlatForest` instead of its dump.
+
+    Args:
+        - scaler_path (str): Path of the scaler dump.
+        - model_paths (dict or None): Paths of the model dumps by model name, `MODEL_PATHS` if None.
+        - mmap_mode (str or None): Memory-map mode of the NumPy arrays of the dumps, see `joblib.load`.
+        - flat_model_paths (dict or None): Directories of the flat exports by model name, `FLAT_MODEL_PATHS` if None.
+
+    Returns:
+        - tuple: The scaler and a dictionary of the models by name.
+    """
+    if model_paths is None:
+        model_paths = MODEL_PATHS
+    if flat_model_paths is None:
+        flat_model_paths = FLAT_MODEL_PATHS
+    scaler = joblib.load(scaler_path)
+    models = {}
+    for name, path in model_paths.items():
+        start = time.perf_counter()
+        flat_path = flat_model_paths.get(name)
+        if flat_path and Path(flat_path).is_dir():
+            models[name] = FlatForest(flat_path, mmap_mode)
+        else:
+            models[name] = joblib.load(path, mmap_mode=mmap_mode)
+        STAGE_SECONDS.labels('load', name).observe(time.perf_counter() - start)
+    return scaler, models
+
+
+def feature_extractor(feature_mode=FEATURE_MODE, max_url_length=URL_LENGTH_LIMIT, budget_ms=FEATURE_BUDGET_MS):
+    """
+    Returns the function extracting the feature vector of a URL in the given mode.
+
+    Args:
+        - feature_mode (str): 'default' for `extract_features`, 'hardened' for `extract_features_hardened`.
+        - max_url_length (int): Length at which URLs are truncated in the hardened mode.
+        - budget_ms (float): CPU time budget per URL in the hardened mode, in milliseconds, 0 for no budget.
+
+    Returns:
+        - callable: A function taking a URL and returning its feature vector.
+    """
+    if feature_mode == 'hardened':
+        return partial(extract_features_hardened, max_length=max_url_length,
+                       budget=budget_ms / 1000 if budget_ms > 0 else None)
+    if feature_mode != 'default':
+        raise ValueError(f"Unknown feature mode '{feature_mode}', expected 'default' or 'hardened'")
+    return extract_features
+
+
+class Scorer:
+    """
+    Classifies URLs with a model, without going through pandas.
+
+    The statistics of the fitted `StandardScaler` are kept as NumPy arrays and applied in place to the feature rows,
+    with the same operations as `StandardScaler.transform`, and the model is called on plain float64 arrays. Single
+    URLs are scaled into a preallocated row owned by the calling thread. Random forests compute `predict` as the
+    argmax of `predict_proba`, so for them (and for their `FlatForest` exports and the cascades) the probabilities are
+    computed once and the class is derived from them.
+
+    URLs are canonicalized like the training set before their features are extracted. When a `KnownIndex` is given,
+    URLs with a known label are answered from it, with their 'source' set to 'index'. When a `VerdictCache` is
+    given, the other verdicts are looked up there by canonical URL and only the missing ones reach the model.
+    URLs whose features exceed their CPU time budget fail closed with the `REJECTED` verdict, and URLs which cannot be
+    parsed with the `INVALID` verdict.
+
+    The time of each stage (lookup in the index and the cache, features, scaling and prediction) and the source of
+    each verdict are recorded in the metrics of `url_utilities.metrics`, labelled with the name of the model.
+
+    Args:
+        - scaler (StandardScaler): The scaler fitted on the training set.
+        - model: The classification model.
+        - name (str or None): Name of the model, used as part of the cache keys.
+        - cache (VerdictCache or None): Cache of the verdicts, shared with the other scorers.
+        - index (KnownIndex or None): Index of the labelled URLs, shared with the other scorers.
+        - extract (callable): Function returning the feature vector of a URL, see `feature_extractor`.
+    """
+
+    def __init__(self, scaler, model, name=None, cache=None, index=None, extract=extract_features):
+        self.model = model
+        self.extract = extract
+        self.name = name
+        self.cache = cache
+        self.index = index
+        n_features = len(FEATURE_COLUMNS)
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else np.zeros(n_features)
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else np.ones(n_features)
+        self.has_proba = hasattr(model, 'predict_proba')
+        self._proba_predicts = self.has_proba and isinstance(model, (RandomForestClassifier, FlatForest, CascadeModel))
+        self._class_labels = [LABELS[int(c)] for c in model.classes_]
+        self._local = threading.local()
+        self._stage = {stage: STAGE_SECONDS.labels(stage, name) for stage in ('lookup', 'features', 'scale', 'predict')}
+        self._verdicts = {source: VERDICTS.labels(name, source)
+                          for source in ('index', 'cache', 'model', 'budget', 'invalid')}
+
+    def _row(self):
+        """
+        Returns the preallocated (1, n_features) row of the calling thread.
+        """
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float64)
+        return row
+
+    def _verdict(self, class_id, proba):
+        class_id = int(class_id)
+        probabilities = None if proba is None else dict(zip(self._class_labels, proba.tolist()))
+        return {'class_id': class_id, 'label': LABELS[class_id], 'probabilities': probabilities, 'source': 'model'}
+
+    def _known(self, key):
+        """
+        Returns the verdict of the index for the canonical URL `key`, or None if the URL is not known.
+        """
+        if self.index is None:
+            return None
+        class_id = self.index.lookup(key)
+        if class_id is None:
+            return None
+        probabilities = {label: float(i == class_id) for i, label in enumerate(LABELS)}
+        return {'class_id': class_id, 'label': LABELS[class_id], 'probabilities': probabilities, 'source': 'index'}
+
+    def _predict(self, features):
+        """
+        Returns the predicted class ids of the scaled `features` and their class probabilities (None if the model
+        does not provide them).
+        """
+        if self._proba_predicts:
+            proba = self.model.predict_proba(features)
+            return self.model.classes_.take(np.argmax(proba, axis=1)), proba
+        class_ids = self.model.predict(features)
+        proba = self.model.predict_proba(features) if self.has_proba else None
+        return class_ids, proba
+
+    def score(self, url):
+        """
+        Classifies a single URL.
+
+        Args:
+            - url (str): The URL to classify.
+
+        Returns:
+            - dict: The URL, the predicted class id, its label, the class probabilities by label (None if the model
+              does not provide them, e.g. an SGD classifier trained with the hinge loss) and the source of the
+              verdict, either 'index' or 'model', or `REJECTED` if the features exceeded their budget and `INVALID`
+              if the URL cannot be parsed.
+
+        Example:
+            >>> Scorer(scaler, model).score("https://bit.ly/abc123")
+            {'url': 'https://bit.ly/abc123', 'class_id': 2, 'label': 'phishing', 'probabilities': {...},
+             'source': 'model'}
+        """
+        start = time.perf_counter()
+        key = canonicalize(url)
+        verdict, source = self._known(key), 'index'
+        if verdict is None and self.cache is not None:
+            verdict, source = self.cache.get(self.name, key), 'cache'
+        now = time.perf_counter()
+        self._stage['lookup'].observe(now - start)
+        if verdict is None:
+            start = now
+            try:
+                features = self.extract(key)
+            except FeatureBudgetExceeded:
+                self._stage['features'].observe(time.perf_counter() - start)
+                self._verdicts['budget'].inc()
+                return {'url': url, **REJECTED}
+            except INVALID_URL_ERRORS:
+                self._stage['features'].observe(time.perf_counter() - start)
+                self._verdicts['invalid'].inc()
+                return {'url': url, **INVALID}
+            now = time.perf_counter()
+            self._stage['features'].observe(now - start)
+            start = now
+            row = self._row()
+            row[0] = features
+            row -= self.mean
+            row /= self.scale
+            now = time.perf_counter()
+            self._stage['scale'].observe(now - start)
+            start = now
+            class_ids, proba = self._predict(row)
+            self._stage['predict'].observe(time.perf_counter() - start)
+            verdict, source = self._verdict(class_ids[0], None if proba is None else proba[0]), 'model'
+            if self.cache is not None:
+                self.cache.put(self.name, key, verdict)
+        self._verdicts[source].inc()
+        return {'url': url, **verdict}
+
+    def score_batch(self, urls):
+        """
+        Classifies a batch of URLs with a single call to the model.
+
+        A URL which cannot be scored only gets its own `REJECTED` or `INVALID` verdict, the others are scored normally.
+
+        Args:
+            - urls (list of str): The URLs to classify.
+
+        Returns:
+            - list of dict: The result of `score` for each URL, in input order.
+        """
+        start = time.perf_counter()
+        keys = [canonicalize(url) for url in urls]
+        verdicts = [self._known(key) for key in keys]
+        known = len(verdicts) - verdicts.count(None)
+        if self.cache is not None:
+            verdicts = [verdict or self.cache.get(self.name, key) for key, verdict in zip(keys, verdicts)]
+        cached = len(verdicts) - verdicts.count(None) - known
+        now = time.perf_counter()
+        self._stage['lookup'].observe(now - start)
+
+        start = now
+        missing, rows = [], []
+        rejected = invalid = 0
+        for i, verdict in enumerate(verdicts):
+            if verdict is None:
+                try:
+                    rows.append(self.extract(keys[i]))
+                    missing.append(i)
+                except FeatureBudgetExceeded:
+                    verdicts[i] = REJECTED
+                    rejected += 1
+                except INVALID_URL_ERRORS:
+                    verdicts[i] = INVALID
+                    invalid += 1
+        if missing or rejected or invalid:
+            self._stage['features'].observe(time.perf_counter() - start)
+        if missing:
+            start = time.perf_counter()
+            features = np.array(rows, dtype=np.float64)
+            features -= self.mean
+            features /= self.scale
+            now = time.perf_counter()
+            self._stage['scale'].observe(now - start)
+            start = now
+            class_ids, proba = self._predict(features)
+            self._stage['predict'].observe(time.perf_counter() - start)
+            for j, i in enumerate(missing):
+                verdicts[i] = self._verdict(class_ids[j], None if proba is None else proba[j])
+                if self.cache is not None:
+                    self.cache.put(self.name, keys[i], verdicts[i])
+        for source, count in (('index', known), ('cache', cached), ('model', len(missing)), ('budget', rejected),
+                              ('invalid', invalid)):
+            if count:
+                self._verdicts[source].inc(count)
+        return [{'url': url, **verdict} for url, verdict in zip(urls, verdicts)]
+
+
+class ModelRegistry:
+    """
+    Holds the scaler and every model loaded once, with a `Scorer` for each model and the verdict cache and the index
+    of the labelled URLs they share.
+
+    The registry is meant to be shared read-only by every session and request of the process, see `get_registry`.
+
+    Args:
+        - scaler_path (str): Path of the scaler dump.
+        - model_paths (dict or None): Paths of the model dumps by model name, `MODEL_PATHS` if None.
+        - mmap_mode (str or None): Memory-map mode of the NumPy arrays of the dumps, see `joblib.load`.
+        - cache_size (int): Largest number of verdicts kept in the cache, 0 to disable it.
+        - cache_ttl (float): Default time-to-live of the cached verdicts, in seconds.
+        - index_path (str or None): Directory of the index of the labelled URLs, not used if it does not exist.
+        - extract (callable or None): Function returning the feature vector of a URL, `feature_extractor()` if None.
+        - cascade_path (str or None): Calibration file of the cascade, added as the 'cascade' model if it exists.
+        - flat_model_paths (dict or None): Directories of the flat exports by model name, `FLAT_MODEL_PATHS` if None.
+    """
+
+    def __init__(self, scaler_path=SCALER_PATH, model_paths=None, mmap_mode=MMAP_MODE, cache_size=CACHE_SIZE,
+                 cache_ttl=CACHE_TTL, index_path=KNOWN_INDEX_PATH, extract=None, cascade_path=CASCADE_CONFIG_PATH,
+                 flat_model_paths=None):
+        self.scaler, self.models = load_models(scaler_path, model_paths, mmap_mode, flat_model_paths)
+        if cascade_path and Path(cascade_path).is_file():
+            self.models['cascade'] = load_cascade(self.models, cascade_path)
+        model_ttl = {name: float(os.environ[f'SECURL_CACHE_TTL_{name.upper()}']) for name in self.models
+                     if f'SECURL_CACHE_TTL_{name.upper()}' in os.environ}
+        self.cache = VerdictCache(cache_size, cache_ttl, model_ttl) if cache_size > 0 else None
+        if self.cache is not None:
+            CACHE_ENTRIES.set_function(self.cache.__len__)
+            CACHE_EVICTIONS.set_function(lambda: self.cache.evictions)
+        if index_path and Path(index_path).is_dir():
+            self.index = KnownIndex(index_path, INDEX_DOMAIN_MIN_COUNT)
+        else:
+            self.index = None
+        extract = extract if extract is not None else feature_extractor()
+        self.scorers = {name: Scorer(self.scaler, model, name, self.cache, self.index, extract)
+                        for name, model in self.models.items()}
+
+    def __contains__(self, name):
+        return name in self.scorers
+
+    def scorer(self, name):
+        """
+        Returns the scorer of the model called `name`, raising a KeyError if it does not exist.
+        """
+        return self.scorers[name]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Returns the process-wide `ModelRegistry`, loading the models the first time it is called.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
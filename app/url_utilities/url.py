@@ -1,7 +1,117 @@
 from tld import get_tld, is_tld
+import os
 import re
+import time
+from pathlib import Path
 from urllib.parse import urlparse
 
+# Ordered feature vector produced by `extract_features`; it matches the column order used at training time.
+FEATURE_COLUMNS = ['url_len', '@', '?', '-', '=', '.', '#', '%', '+', '$', '!', '*', ',', '//', 'abnormal_url', 'https',
+                   'digits', 'letters', 'shortening_service', 'ip_address']
+
+_SPECIAL_CHARS = ('@', '?', '-', '=', '.', '#', '%', '+', '$', '!', '*', ',')
+
+_IP_RE = re.compile(
+    r'(([01]?\d\d?|2[0-4]\d|25[0-5])\.([01]?\d\d?|2[0-4]\d|25[0-5])\.([01]?\d\d?|2[0-4]\d|25[0-5])\.'
+    r'([01]?\d\d?|2[0-4]\d|25[0-5])\/)|'  # IPv4
+    r'(([01]?\d\d?|2[0-4]\d|25[0-5])\.([01]?\d\d?|2[0-4]\d|25[0-5])\.([01]?\d\d?|2[0-4]\d|25[0-5])\.'
+    r'([01]?\d\d?|2[0-4]\d|25[0-5])\/)|'  # IPv4 with port
+    r'((0x[0-9a-fA-F]{1,2})\.(0x[0-9a-fA-F]{1,2})\.(0x[0-9a-fA-F]{1,2})\.(0x[0-9a-fA-F]{1,2})\/)'  # IPv4 in hexadecimal
+    r'(?:[a-fA-F0-9]{1,4}:){7}[a-fA-F0-9]{1,4}|'
+    r'([0-9]+(?:\.[0-9]+){3}:[0-9]+)|'
+    r'((?:(?:\d|[01]?\d\d|2[0-4]\d|25[0-5])\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d|\d)(?:\/\d{1,2})?)')  # Ipv6
+
+# Necessary condition for `_IP_RE` to match, used as a cheap pre-filter.
+_IP_CANDIDATE_RE = re.compile(r'\d\.\d|0x')
+
+# Linear-time counterpart of `_IP_RE` used by the hardened extraction: only bounded quantifiers, so the work done at
+# each position of the URL is bounded. Matches a dotted-decimal IPv4 address, a hexadecimal IPv4 address or a full
+# IPv6 address anywhere in the URL.
+_IP_SAFE_RE = re.compile(
+    r'(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)|'  # IPv4
+    r'(?:0x[0-9a-fA-F]{1,2}\.){3}0x[0-9a-fA-F]{1,2}|'  # IPv4 in hexadecimal
+    r'(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}')  # IPv6
+
+# Length at which URLs are truncated by the hardened extraction, the same in training and serving.
+MAX_URL_LENGTH = 2048
+
+# Regex metacharacters other than '.', which would change the meaning of a hostname used as a pattern.
+_REGEX_META_RE = re.compile(r'[\^$*+?{}\[\]\\|()]')
+
+# File listing the domains of the URL shortening services, one per line.
+SHORTENERS_PATH = os.environ.get('SECURL_SHORTENERS_PATH', str(Path(__file__).with_name('shorteners.txt')))
+
+# Smallest number of seconds between two checks of the shorteners file for changes.
+SHORTENERS_CHECK_INTERVAL = 30.0
+
+
+class ShortenerIndex:
+    """
+    Set of the domains of the URL shortening services, matched against a hostname and its parent domains.
+
+    The domains are read from a text file with one domain per line, where '#' starts a comment. The modification time
+    of the file is checked at most every `check_interval` seconds and the domains are reloaded when it changes, so the
+    list can be updated without rebuilding the image.
+
+    Args:
+        - path (str): Path of the file listing the domains.
+        - check_interval (float): Smallest number of seconds between two checks of the file for changes.
+
+    Example:
+        >>> ShortenerIndex().matches("m.bit.ly")
+        True
+    """
+
+    def __init__(self, path=SHORTENERS_PATH, check_interval=SHORTENERS_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._next_check = time.monotonic() + check_interval
+        self.reload()
+
+    def reload(self):
+        """
+        Reads the domains from the file, raising an OSError if it cannot be read.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        domains = set()
+        with open(self.path) as shorteners_file:
+            for line in shorteners_file:
+                domain = line.split('#', 1)[0].strip().lower()
+                if domain:
+                    domains.add(domain)
+        self.domains = frozenset(domains)
+        self._mtime = mtime
+
+    def _check_for_changes(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                self.reload()
+        except OSError:
+            # Keeps the current domains while the file is being replaced.
+            pass
+
+    def matches(self, hostname):
+        """
+        Returns True if `hostname`, or one of its parent domains, is the domain of a URL shortening service.
+        """
+        self._check_for_changes()
+        domains = self.domains
+        while hostname:
+            if hostname in domains:
+                return True
+            dot = hostname.find('.')
+            if dot < 0:
+                return False
+            hostname = hostname[dot + 1:]
+        return False
+
+
+shorteners = ShortenerIndex()
+
 
 def process_tld(url):
     """
@@ -25,6 +135,21 @@ def process_tld(url):
     return pri_domain
 
 
+def _hostname(url, parsed=None):
+    """
+    Returns the hostname of the given URL, also when it has no scheme (e.g. 'bit.ly/abc123'), or None.
+    """
+    try:
+        if parsed is None:
+            parsed = urlparse(url)
+        hostname = parsed.hostname
+        if hostname is None:
+            hostname = urlparse('//' + url).hostname
+    except ValueError:
+        return None
+    return hostname
+
+
 def abnormal_url(url):
     """
     Checks if the given URL does not contain its hostname, which may indicate abnormal URL patterns.
@@ -114,7 +239,8 @@ def letter_count(url):
 
 def shortening_service(url):
     """
-    Checks if the given URL is associated with a URL shortening service.
+    Checks if the given URL is associated with a URL shortening service, i.e. if its hostname belongs to one of the
+    domains listed in the shorteners file.
 
     Args:
         - url (str): The URL to check for association with URL shortening services.
@@ -126,16 +252,7 @@ def shortening_service(url):
         >>> shortening_service("https://bit.ly/abc123")
         1
     """
-    match = re.search('bit\.ly|goo\.gl|shorte\.st|go2l\.ink|x\.co|ow\.ly|t\.co|tinyurl|tr\.im|is\.gd|cli\.gs|'
-                      'yfrog\.com|migre\.me|ff\.im|tiny\.cc|url4\.eu|twit\.ac|su\.pr|twurl\.nl|snipurl\.com|'
-                      'short\.to|BudURL\.com|ping\.fm|post\.ly|Just\.as|bkite\.com|snipr\.com|fic\.kr|loopt\.us|'
-                      'doiop\.com|short\.ie|kl\.am|wp\.me|rubyurl\.com|om\.ly|to\.ly|bit\.do|t\.co|lnkd\.in|'
-                      'db\.tt|qr\.ae|adf\.ly|goo\.gl|bitly\.com|cur\.lv|tinyurl\.com|ow\.ly|bit\.ly|ity\.im|'
-                      'q\.gs|is\.gd|po\.st|bc\.vc|twitthis\.com|u\.to|j\.mp|buzurl\.com|cutt\.us|u\.bb|yourls\.org|'
-                      'x\.co|prettylinkpro\.com|scrnch\.me|filoops\.info|vzturl\.com|qr\.net|1url\.com|tweez\.me|v\.gd|'
-                      'tr\.im|link\.zip\.net',
-                      url)
-    if match:
+    if shorteners.matches(_hostname(url)):
         return 1
     else:
         return 0
@@ -155,16 +272,107 @@ def ip_address(url):
         >>> ip_address("https://192.168.0.1/path/to/page")
         1
     """
-    match = re.search(
-        '(([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.'
-        '([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\/)|'  # IPv4
-        '(([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.'
-        '([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\/)|'  # IPv4 with port
-        '((0x[0-9a-fA-F]{1,2})\\.(0x[0-9a-fA-F]{1,2})\\.(0x[0-9a-fA-F]{1,2})\\.(0x[0-9a-fA-F]{1,2})\\/)' # IPv4 in hexadecimal
-        '(?:[a-fA-F0-9]{1,4}:){7}[a-fA-F0-9]{1,4}|'
-        '([0-9]+(?:\.[0-9]+){3}:[0-9]+)|'
-        '((?:(?:\d|[01]?\d\d|2[0-4]\d|25[0-5])\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d|\d)(?:\/\d{1,2})?)', url)  # Ipv6
+    match = _IP_RE.search(url)
     if match:
         return 1
     else:
-        return 0
\ No newline at end of file
+        return 0
+
+def extract_features(url):
+    """
+    Builds the full feature vector of the given URL, in the order of `FEATURE_COLUMNS`.
+
+    The URL is parsed only once and the IP address check reuses a precompiled pattern, which is skipped when the URL
+    cannot contain a match (every alternative needs three dots and either a "digit.digit" sequence or a hexadecimal
+    "0x" octet). The hostname is looked up as a plain substring whenever that is equivalent to using it as a pattern,
+    so that a new regex is not compiled for every distinct hostname. The result is identical to calling the
+    individual feature functions of this module one by one.
+
+    Args:
+        - url (str): The URL from which to extract the features.
+
+    Returns:
+        - list of int: The feature vector of the URL.
+
+    Example:
+        >>> extract_features("https://bit.ly/abc123")
+        [21, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 3, 13, 1, 0]
+    """
+    row = [len(url)]
+    row.extend([url.count(c) for c in _SPECIAL_CHARS])
+    row.append(url.count('//'))
+
+    parsed = urlparse(url)
+    hostname = str(parsed.hostname)
+    if hostname in url and not _REGEX_META_RE.search(hostname):
+        row.append(1)
+    else:
+        row.append(1 if re.search(hostname, url) else 0)
+    row.append(1 if parsed.scheme == 'https' else 0)
+    row.append(sum(map(str.isnumeric, url)))
+    row.append(sum(map(str.isalpha, url)))
+    row.append(1 if shorteners.matches(_hostname(url, parsed)) else 0)
+    if row[5] >= 3 and _IP_CANDIDATE_RE.search(url):
+        row.append(1 if _IP_RE.search(url) else 0)
+    else:
+        row.append(0)
+    return row
+
+
+class FeatureBudgetExceeded(Exception):
+    """
+    Raised when the features of a URL take longer than their CPU time budget to extract.
+    """
+
+
+def _check_budget(deadline):
+    if deadline is not None and time.thread_time() > deadline:
+        raise FeatureBudgetExceeded('The feature extraction exceeded its CPU time budget')
+
+
+def extract_features_hardened(url, max_length=MAX_URL_LENGTH, budget=None):
+    """
+    Builds the feature vector of a possibly hostile URL, in the order of `FEATURE_COLUMNS`, in linear time.
+
+    The URL is first truncated to `max_length` characters and every feature is computed on the truncated URL. The
+    hostname is looked up as a plain substring instead of being used as a pattern, IP addresses are detected with a
+    pattern made only of bounded quantifiers, and a URL which cannot be parsed has no hostname and no scheme instead of
+    raising. Models must be trained on features extracted with the same function and the same `max_length`.
+
+    Args:
+        - url (str): The URL from which to extract the features.
+        - max_length (int): Number of characters of the URL which are analysed.
+        - budget (float or None): CPU time allowed for the extraction, in seconds, or None for no limit.
+
+    Returns:
+        - list of int: The feature vector of the URL.
+
+    Raises:
+        - FeatureBudgetExceeded: If the extraction takes more than `budget` seconds of CPU time.
+
+    Example:
+        >>> extract_features_hardened("https://bit.ly/abc123")
+        [21, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 3, 13, 1, 0]
+    """
+    deadline = time.thread_time() + budget if budget is not None else None
+    url = url[:max_length]
+    row = [len(url)]
+    row.extend([url.count(c) for c in _SPECIAL_CHARS])
+    row.append(url.count('//'))
+
+    try:
+        parsed = urlparse(url)
+        hostname = parsed.hostname
+        scheme = parsed.scheme
+    except ValueError:
+        parsed, hostname, scheme = None, None, ''
+    row.append(1 if hostname and hostname in url else 0)
+    row.append(1 if scheme == 'https' else 0)
+    row.append(sum(map(str.isnumeric, url)))
+    row.append(sum(map(str.isalpha, url)))
+    _check_budget(deadline)
+
+    row.append(1 if shorteners.matches(_hostname(url, parsed)) else 0)
+    row.append(1 if _IP_SAFE_RE.search(url) else 0)
+    _check_budget(deadline)
+    return row
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.preprocessing import StandardScaler
+
+from corpus import generate_corpus, write_csv
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'app'))
+sys.path.insert(0, str(ROOT / 'load_data'))
+# `load_data` imports `profiling`, copied next to it in its image.
+sys.path.append(str(ROOT / 'app' / 'url_utilities'))
+
+import load_data  # noqa: E402
+from url_utilities.cache import canonicalize  # noqa: E402
+from url_utilities.forest import FlatForest, export_forest  # noqa: E402
+from url_utilities.scoring import MODEL_PATHS, Scorer  # noqa: E402
+from url_utilities.url import extract_features, extract_features_hardened  # noqa: E402
+
+# Version of the layout of the results file.
+RESULTS_FORMAT_VERSION = 1
+
+# Default relative change of a metric, in the wrong direction, reported as a regression by the comparison.
+DEFAULT_THRESHOLD = 0.10
+
+# Sizes of the batches of the batch scoring benchmarks.
+BATCH_SIZES = (100, 1000)
+
+
+def _best_time(function, repeat):
+    """
+    Returns the shortest wall-clock time of `repeat` calls of `function`, the least disturbed by the rest of the
+    machine.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _throughput(count, seconds):
+    return {'value': count / seconds, 'unit': 'urls/s', 'higher_is_better': True}
+
+
+def _latency(seconds):
+    return {'value': seconds * 1000, 'unit': 'ms', 'higher_is_better': False}
+
+
+def bench_features(urls, repeat):
+    """
+    Measures the throughput of the feature extraction of single URLs, in both extraction modes.
+    """
+    keys = [canonicalize(url) for url in urls]
+    results = {}
+    for name, extract in (('features.default', extract_features), ('features.hardened', extract_features_hardened)):
+        seconds = _best_time(lambda: [extract(key) for key in keys], repeat)
+        results[name] = _throughput(len(keys), seconds)
+    return results
+
+
+def bench_load_data(corpus, repeat, directory):
+    """
+    Measures the throughput of the batch extraction of `load_data`, which cleans, hashes and extracts the features of
+    the rows of a CSV dataset.
+    """
+    path = Path(directory) / 'malicious_phish.csv'
+    write_csv(corpus, path)
+    results = {}
+    seconds = _best_time(lambda: load_data._extract_dataset(str(path)), repeat)
+    results['load_data.extract'] = _throughput(len(corpus), seconds)
+    seconds = _best_time(lambda: load_data._extract_dataset(str(path), chunk_size=len(corpus) // 4 or 1), repeat)
+    results['load_data.extract_chunked'] = _throughput(len(corpus), seconds)
+    return results
+
+
+def _standin_models(corpus, directory):
+    """
+    Fits deterministic models with the hyperparameters of the trainers on the corpus, when no dumps are given.
+    """
+    features = np.array([extract_features(canonicalize(url)) for url, _ in corpus], dtype=np.float64)
+    labels = np.array([['benign', 'defacement', 'phishing', 'malware'].index(category) for _, category in corpus])
+    scaler = StandardScaler().fit(features)
+    x = scaler.transform(features)
+    models = {
+        'rf': RandomForestClassifier(n_estimators=100, class_weight='balanced', random_state=0).fit(x, labels),
+        'sgd': SGDClassifier(random_state=0).fit(x, labels),
+        'nb': GaussianNB().fit(x, labels),
+    }
+    export_forest(models['rf'], Path(directory) / 'rf_flat')
+    models['rf_flat'] = FlatForest(Path(directory) / 'rf_flat')
+    return scaler, models
+
+
+def _dump_models(models_directory, directory):
+    """
+    Loads the scaler and the model dumps of a models directory, with the flat export of the random forest.
+    """
+    models_directory = Path(models_directory)
+    scaler = joblib.load(models_directory / 'scaler.joblib')
+    models = {name: joblib.load(models_directory / Path(path).name) for name, path in MODEL_PATHS.items()}
+    flat_directory = models_directory / 'rf_flat'
+    if not flat_directory.is_dir():
+        flat_directory = Path(directory) / 'rf_flat'
+        export_forest(models['rf'], flat_directory)
+    models['rf_flat'] = FlatForest(flat_directory)
+    return scaler, models
+
+
+def bench_inference(urls, scaler, models, repeat):
+    """
+    Measures the latency of single URL scoring and the throughput of batch scoring of each model, without cache nor
+    index so that every URL reaches the model.
+    """
+    results = {}
+    for name, model in models.items():
+        scorer = Scorer(scaler, model, name)
+        samples = urls[:200]
+        latencies = []
+        for _ in range(repeat):
+            for url in samples:
+                start = time.perf_counter()
+                scorer.score(url)
+                latencies.append(time.perf_counter() - start)
+        results[f'score.{name}.p50'] = _latency(float(np.percentile(latencies, 50)))
+        results[f'score.{name}.p95'] = _latency(float(np.percentile(latencies, 95)))
+        for size in BATCH_SIZES:
+            batch = urls[:size]
+            seconds = _best_time(lambda: scorer.score_batch(batch), repeat)
+            results[f'score_batch.{name}.{size}'] = _throughput(len(batch), seconds)
+    return results
+
+
+def run(args):
+    corpus = generate_corpus(args.size, args.seed)
+    urls = [url for url, _ in corpus]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results.update(bench_features(urls, args.repeat))
+        results.update(bench_load_data(corpus, args.repeat, directory))
+        if args.models:
+            scaler, models = _dump_models(args.models, directory)
+        else:
+            scaler, models = _standin_models(corpus, directory)
+        results.update(bench_inference(urls, scaler, models, args.repeat))
+
+    report = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'scikit-learn': sklearn.__version__,
+                        'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'corpus': {'size': args.size, 'seed': args.seed},
+        'models': args.models or 'stand-in',
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    for name, result in results.items():
+        print(f"{name:40s} {result['value']:14.2f} {result['unit']}")
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares two results files and lists the metrics which got worse by more than `threshold`.
+
+    Args:
+        - baseline (dict): Results of the reference run.
+        - current (dict): Results of the run to check.
+        - threshold (float): Largest relative change in the wrong direction which is not a regression.
+
+    Returns:
+        - list of str: The names of the metrics which regressed.
+
+    Example:
+        >>> compare({'results': {'features.default': {'value': 100, ...}}},
+        ...         {'results': {'features.default': {'value': 80, ...}}})
+        ['features.default']
+    """
+    regressions = []
+    for name, old in baseline['results'].items():
+        new = current['results'].get(name)
+        if new is None:
+            continue
+        change = (new['value'] - old['value']) / old['value']
+        worse = -change if old['higher_is_better'] else change
+        flag = 'REGRESSION' if worse > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:40s} {old['value']:14.2f} {new['value']:14.2f} {change:+8.1%} {flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the feature extraction, preprocessing and scoring.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Runs the benchmarks and writes their results as JSON.')
+    run_parser.add_argument('--output', type=str, default='benchmark.json')
+    run_parser.add_argument('--size', type=int, default=20000, help='Number of URLs of the synthetic corpus.')
+    run_parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic corpus.')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each measure.')
+    run_parser.add_argument('--models', type=str, default=None,
+                            help='Directory of the scaler and model dumps (e.g. app/models), by default stand-in '
+                                 'models are fitted on the corpus.')
+
+    compare_parser = subparsers.add_parser('compare', help='Compares two results files.')
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('current', type=str)
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='Relative change in the wrong direction reported as a regression.')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        with open(args.baseline) as baseline_file, open(args.current) as current_file:
+            baseline, current = json.load(baseline_file), json.load(current_file)
+        if baseline['corpus'] != current['corpus'] or baseline['models'] != current['models']:
+            print('Warning: the results were measured on different corpora or models')
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,115 @@
+import csv
+import random
+import string
+from pathlib import Path
+
+SHORTENERS_PATH = Path(__file__).resolve().parent.parent / 'app' / 'url_utilities' / 'shorteners.txt'
+
+# Share of each kind of URL in the corpus.
+URL_KINDS = {
+    'domain': 0.25,
+    'path': 0.25,
+    'query': 0.15,
+    'ip': 0.08,
+    'hex_ip': 0.02,
+    'shortener': 0.12,
+    'long': 0.08,
+    'unusual': 0.05,
+}
+
+# Share of each category in the corpus, close to the one of malicious_phish.csv.
+CATEGORIES = {'benign': 0.66, 'defacement': 0.15, 'phishing': 0.14, 'malware': 0.05}
+
+_TLDS = ['com', 'org', 'net', 'it', 'de', 'co.uk', 'info', 'ru', 'br', 'io']
+_WORDS = ['login', 'secure', 'account', 'update', 'bank', 'paypal', 'mail', 'news', 'shop', 'index', 'images',
+          'wp-content', 'admin', 'verify', 'docs', 'blog', 'cart', 'search', 'home', 'download']
+
+
+def _shorteners():
+    with open(SHORTENERS_PATH) as shorteners_file:
+        domains = [line.split('#', 1)[0].strip() for line in shorteners_file]
+    return sorted(domain for domain in domains if domain)
+
+
+def _word(rng, length=None):
+    if length is None or rng.random() < 0.6:
+        return rng.choice(_WORDS)
+    return ''.join(rng.choices(string.ascii_lowercase + string.digits, k=length))
+
+
+def _domain(rng):
+    labels = [_word(rng, rng.randint(3, 12)) for _ in range(rng.choice([1, 1, 2, 3]))]
+    prefix = 'www.' if rng.random() < 0.3 else ''
+    return prefix + '.'.join(labels) + '.' + rng.choice(_TLDS)
+
+
+def _path(rng, parts):
+    return '/' + '/'.join(_word(rng, rng.randint(2, 15)) for _ in range(parts))
+
+
+def _query(rng, parameters):
+    return '?' + '&'.join(f'{_word(rng, 6)}={_word(rng, rng.randint(1, 40))}' for _ in range(parameters))
+
+
+def _scheme(rng):
+    return rng.choice(['http://', 'https://', ''])
+
+
+def _url(rng, kind, shorteners):
+    if kind == 'domain':
+        return _scheme(rng) + _domain(rng)
+    if kind == 'path':
+        return _scheme(rng) + _domain(rng) + _path(rng, rng.randint(1, 5))
+    if kind == 'query':
+        return _scheme(rng) + _domain(rng) + _path(rng, rng.randint(1, 3)) + _query(rng, rng.randint(3, 15))
+    if kind == 'ip':
+        ip = '.'.join(str(rng.randint(1, 254)) for _ in range(4))
+        return rng.choice(['http://', '']) + ip + _path(rng, rng.randint(0, 3))
+    if kind == 'hex_ip':
+        ip = '.'.join(f'0x{rng.randint(1, 254):02X}' for _ in range(4))
+        return 'http://' + ip + _path(rng, rng.randint(1, 2))
+    if kind == 'shortener':
+        return _scheme(rng) + rng.choice(shorteners) + '/' + _word(rng, rng.randint(5, 9))
+    if kind == 'long':
+        return (_scheme(rng) + _domain(rng) + _path(rng, rng.randint(5, 20)) + _query(rng, rng.randint(15, 60))
+                + '#' + _word(rng, 30))
+    # URLs with the special characters counted by the features after their host, which the default extraction
+    # expects to be well-formed.
+    special = ''.join(rng.choices('@?-=.#%+$!*,//', k=rng.randint(3, 20)))
+    return _scheme(rng) + _domain(rng) + '/' + _word(rng, 8) + special + _domain(rng)
+
+
+def generate_corpus(size=20000, seed=0):
+    """
+    Generates a deterministic synthetic corpus of labelled URLs.
+
+    The corpus mixes the kinds of URLs of `URL_KINDS`: bare domains, paths, long query strings, dotted and
+    hexadecimal IP addresses, URL shortening services, very long URLs and URLs full of special characters. The same
+    `size` and `seed` always give the same corpus, so timings of different runs measure the same work.
+
+    Args:
+        - size (int): Number of URLs.
+        - seed (int): Seed of the generator.
+
+    Returns:
+        - list of tuple: The (url, category) pairs.
+
+    Example:
+        >>> generate_corpus(2)
+        [('https://login.net/secure', 'benign'), ...]
+    """
+    rng = random.Random(seed)
+    shorteners = _shorteners()
+    kinds = rng.choices(list(URL_KINDS), weights=list(URL_KINDS.values()), k=size)
+    categories = rng.choices(list(CATEGORIES), weights=list(CATEGORIES.values()), k=size)
+    return [(_url(rng, kind, shorteners), category) for kind, category in zip(kinds, categories)]
+
+
+def write_csv(corpus, path):
+    """
+    Writes a corpus as a CSV with the 'url' and 'type' columns of malicious_phish.csv.
+    """
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['url', 'type'])
+        writer.writerows(corpus)
@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import joblib
+
+from bench import ROOT, _standin_models
+from corpus import generate_corpus
+
+sys.path.insert(0, str(ROOT / 'app'))
+
+from aiohttp import web  # noqa: E402
+from api import create_app  # noqa: E402
+from url_utilities.scoring import ModelRegistry  # noqa: E402
+
+
+def _write_models(directory, size, seed):
+    """
+    Fits the stand-in models of the benchmarks on a synthetic corpus and writes them with the layout of `app/models`,
+    the random forest both as a dump and as a flat export.
+    """
+    models_directory = Path(directory) / 'models'
+    models_directory.mkdir(parents=True, exist_ok=True)
+    scaler, models = _standin_models(generate_corpus(size, seed), models_directory)
+    joblib.dump(scaler, models_directory / 'scaler.joblib')
+    for name in ('rf', 'sgd', 'nb'):
+        joblib.dump(models[name], models_directory / f'{name}.joblib')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the scoring API with stand-in models, as a local target of '
+                                                 'the load tests.')
+    parser.add_argument('--directory', type=str, default='standin',
+                        help='Directory of the stand-in models, fitted and written there if it has none.')
+    parser.add_argument('--size', type=int, default=20000, help='Number of URLs of the training corpus.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the training corpus.')
+    parser.add_argument('--flat', action='store_true', help='Serves the random forest from its flat export.')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8080')))
+    args = parser.parse_args()
+
+    if not (Path(args.directory) / 'models' / 'scaler.joblib').is_file():
+        _write_models(args.directory, args.size, args.seed)
+    # The registry resolves its default paths, such as the flat export or the cascade, from the working directory.
+    os.chdir(args.directory)
+    registry = ModelRegistry(flat_model_paths=None if args.flat else {})
+    web.run_app(create_app(registry), port=args.port)
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Version of the layout of the feature store directory, recorded in its manifest.
+FEATURE_STORE_FORMAT_VERSION = 1
+
+# Number of segments above which the store is rewritten as a single segment when it is opened.
+MAX_SEGMENTS = 8
+
+# Number of feature rows copied at a time into a new segment.
+WRITE_BLOCK_SIZE = 100000
+
+# Scratch file of the directory of a schema holding the feature rows collected by a `SegmentWriter`.
+PENDING_FEATURES_FILE = 'pending-features.int64'
+
+
+def schema_key(schema):
+    """
+    Returns the key of a feature schema, the name of the directory holding its features.
+
+    Args:
+        - schema (dict): JSON-serializable description of everything the feature vectors depend on.
+
+    Returns:
+        - str: A 16-character hexadecimal digest of the schema.
+    """
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class FeatureStore:
+    """
+    On-disk store of the feature vectors of the URLs already seen, keyed by the 64-bit hash of the canonical URL.
+
+    Features are stored under a directory named after the key of their schema (feature columns, extraction mode,
+    shortener list, ...), so a change of any of them starts from an empty store instead of mixing incompatible
+    vectors. Each run appends the vectors it had to extract as a new segment, a pair of .npy arrays with the sorted
+    hashes and the matching int64 feature rows. Segments are listed in a manifest which is replaced atomically, so an
+    interrupted run never leaves a partial segment visible. When there are more than `MAX_SEGMENTS` segments they are
+    merged into one the next time the store is opened.
+
+    The arrays are memory-mapped and a pickled store only carries its location and schema, so it can be sent to the
+    worker processes extracting the features, which map the segments again on their first lookup.
+
+    Args:
+        - root (str): Directory of the store, shared by all the schemas.
+        - schema (dict): Description of everything the feature vectors depend on, see `schema_key`.
+        - n_features (int): Number of features of a vector.
+    """
+
+    def __init__(self, root, schema, n_features):
+        self.root = Path(root)
+        self.schema = schema
+        self.n_features = n_features
+        self.directory = self.root / schema_key(schema)
+        self._hashes = None
+        self._features = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_hashes'] = state['_features'] = None
+        return state
+
+    def _read_manifest(self):
+        try:
+            with open(self.directory / 'manifest.json') as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            return []
+        if manifest['format_version'] != FEATURE_STORE_FORMAT_VERSION:
+            return []
+        return manifest['segments']
+
+    def _write_manifest(self, segments):
+        manifest = {'format_version': FEATURE_STORE_FORMAT_VERSION, 'schema': self.schema, 'segments': segments}
+        temporary = self.directory / 'manifest.json.tmp'
+        with open(temporary, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporary, self.directory / 'manifest.json')
+
+    def _write_segment(self, hashes, features, rows):
+        """
+        Writes a segment from unique sorted hashes and the indices of their `rows` in `features`, returning its name.
+        The rows are copied by blocks, so `features` may be memory-mapped and larger than the memory.
+        """
+        names = {path.name.split('-')[1] for path in self.directory.glob('segment-*')}
+        number = max((int(name) for name in names if name.isdigit()), default=0) + 1
+        name = f'segment-{number:05d}'
+        np.save(self.directory / f'{name}-hashes.npy', hashes)
+        segment = np.lib.format.open_memmap(self.directory / f'{name}-features.npy', mode='w+', dtype=np.int64,
+                                            shape=(len(rows), self.n_features))
+        for start in range(0, len(rows), WRITE_BLOCK_SIZE):
+            segment[start:start + WRITE_BLOCK_SIZE] = features[rows[start:start + WRITE_BLOCK_SIZE]]
+        segment.flush()
+        del segment
+        return name
+
+    def _load_segments(self, segments):
+        hashes, features = [], []
+        for name in segments:
+            hashes.append(np.load(self.directory / f'{name}-hashes.npy', mmap_mode='r'))
+            features.append(np.load(self.directory / f'{name}-features.npy', mmap_mode='r'))
+        return hashes, features
+
+    def _remove_unlisted(self, segments):
+        listed = set(segments)
+        for path in self.directory.glob('segment-*.npy'):
+            if path.name.rsplit('-', 1)[0] not in listed:
+                path.unlink()
+        # Left by an interrupted run, whose segment was never written.
+        (self.directory / PENDING_FEATURES_FILE).unlink(missing_ok=True)
+
+    def open(self):
+        """
+        Creates the directory of the schema if needed, merges the segments if there are too many and maps them.
+
+        Returns:
+            - FeatureStore: The store itself.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = self._read_manifest()
+        if len(segments) > MAX_SEGMENTS:
+            hashes, features = self._load_segments(segments)
+            features = np.concatenate(features)
+            hashes, rows = _unique(np.concatenate(hashes))
+            segments = [self._write_segment(hashes, features, rows)]
+            self._write_manifest(segments)
+        self._remove_unlisted(segments)
+        if not segments:
+            self._write_manifest(segments)
+        self._map()
+        return self
+
+    def _map(self):
+        self._hashes, self._features = self._load_segments(self._read_manifest())
+
+    def __len__(self):
+        if self._hashes is None:
+            self._map()
+        return sum(len(hashes) for hashes in self._hashes)
+
+    def lookup(self, hashes):
+        """
+        Reads the stored feature vectors of the given URL hashes.
+
+        Args:
+            - hashes (numpy.ndarray): uint64 hashes of the canonical URLs.
+
+        Returns:
+            - tuple: An int64 matrix with one row per hash, filled for the stored ones, and the boolean mask of the
+              hashes which were found.
+        """
+        if self._hashes is None:
+            self._map()
+        features = np.zeros((len(hashes), self.n_features), dtype=np.int64)
+        found = np.zeros(len(hashes), dtype=bool)
+        for segment_hashes, segment_features in zip(self._hashes, self._features):
+            if not len(segment_hashes):
+                continue
+            position = np.searchsorted(segment_hashes, hashes)
+            position[position == len(segment_hashes)] = 0
+            hit = (segment_hashes[position] == hashes) & ~found
+            features[hit] = segment_features[position[hit]]
+            found |= hit
+        return features, found
+
+    def add(self, hashes, features):
+        """
+        Appends the feature vectors of new URLs to the store as one segment.
+
+        Args:
+            - hashes (numpy.ndarray): uint64 hashes of the canonical URLs, possibly repeated.
+            - features (numpy.ndarray): Their int64 feature matrix, possibly memory-mapped.
+        """
+        if not len(hashes):
+            return
+        hashes, rows = _unique(np.asarray(hashes, dtype=np.uint64))
+        segments = self._read_manifest() + [self._write_segment(hashes, features, rows)]
+        self._write_manifest(segments)
+        self._map()
+
+    def writer(self):
+        """
+        Returns a `SegmentWriter` collecting the feature vectors of new URLs into one segment of the store.
+        """
+        return SegmentWriter(self)
+
+
+class SegmentWriter:
+    """
+    Collects the feature vectors of new URLs block by block, e.g. for each chunk of a streamed dataset, and appends
+    them to a `FeatureStore` as one segment when closed. The rows are written to a scratch file of the store as they
+    are appended and only their hashes are kept in memory, a few bytes per row.
+
+    Args:
+        - store (FeatureStore): The opened store receiving the segment.
+
+    Example:
+        >>> writer = store.writer()
+        >>> for hashes, features in blocks:
+        ...     writer.append(hashes, features)
+        >>> writer.close()
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.directory / PENDING_FEATURES_FILE
+        self._file = open(self.path, 'wb')
+        self._hashes = []
+
+    def append(self, hashes, features):
+        """
+        Adds the feature vectors of new URLs, given by their uint64 hashes and their int64 feature matrix.
+        """
+        self._file.write(np.ascontiguousarray(features, dtype=np.int64).tobytes())
+        self._hashes.append(np.asarray(hashes, dtype=np.uint64))
+
+    def close(self):
+        """
+        Appends the collected vectors to the store as one segment and removes the scratch file.
+        """
+        self._file.close()
+        try:
+            rows = sum(len(hashes) for hashes in self._hashes)
+            if rows:
+                features = np.memmap(self.path, dtype=np.int64, mode='r', shape=(rows, self.store.n_features))
+                self.store.add(np.concatenate(self._hashes), features)
+                del features
+        finally:
+            self.path.unlink()
+
+
+def _unique(hashes):
+    """
+    Sorts the hashes and keeps the last row of each one, returning the unique hashes and the indices of their rows.
+    """
+    order = np.argsort(hashes, kind='stable')[::-1]
+    unique_hashes, first = np.unique(hashes[order], return_index=True)
+    return unique_hashes, order[first]
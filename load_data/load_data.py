@@ -5,235 +5,400 @@ from sklearn.model_selection import train_test_split
 import json
 from sklearn.preprocessing import StandardScaler
 from joblib import dump
-from tld import get_tld
-import re
-from urllib.parse import urlparse
 import numpy as np
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from feature_store import FeatureStore
+from profiling import PROFILE_DIR, PROFILE_MODE, PROFILE_MODES, profile
+from url import FEATURE_COLUMNS, MAX_URL_LENGTH, extract_features, extract_features_hardened, process_tld, shorteners
 
+DATASET_PATH = 'malicious_phish.csv'
 
-def process_tld(url):
+# Number of rows read at a time when the dataset is processed in parallel without an explicit chunk size.
+DEFAULT_CHUNK_SIZE = 50000
+
+# Version of the layout of the dataset directory shared with the trainers, recorded in its manifest.
+DATASET_FORMAT_VERSION = 1
+
+# Number of rows scaled and written at a time into the dataset arrays.
+WRITE_BLOCK_SIZE = 100000
+
+# Scratch file of the dataset directory holding the unscaled feature matrix while the dataset is streamed, removed
+# once the splits are written.
+FEATURES_SCRATCH_FILE = 'features.int64'
+
+# Version of the layout of the known URL index, recorded in its manifest.
+INDEX_FORMAT_VERSION = 1
+
+# Version of the feature extraction code of `url`, part of the schema of the feature store. It must be increased
+# whenever a change of the extraction functions alters the features of some URL, so that the cached vectors are not
+# reused.
+FEATURE_SCHEMA_VERSION = 1
+
+
+def feature_extractor(feature_mode='default', max_url_length=MAX_URL_LENGTH):
     """
-    Extracts the top-level domain (TLD) from the given URL using the 'tldextract' library.
+    Returns the function extracting the feature vector of a URL in the given mode.
 
     Args:
-        - url (str): The URL from which to extract the TLD.
+        - feature_mode (str): 'default' for `extract_features`, 'hardened' for `extract_features_hardened`.
+        - max_url_length (int): Length at which URLs are truncated in the hardened mode.
 
     Returns:
-        - str or None: The top-level domain extracted from the URL. Returns None if the extraction fails.
-
-    Example:
-        >>> process_tld("https://www.example.com/path/to/page")
-        'www.example.com'
+        - callable: A function taking a URL and returning its feature vector.
     """
-    try:
-        res = get_tld(url, as_object=True, fail_silently=False, fix_protocol=True)
-        pri_domain = res.parsed_url.netloc
-    except:
-        pri_domain = None
-    return pri_domain
+    if feature_mode == 'hardened':
+        return partial(extract_features_hardened, max_length=max_url_length)
+    return extract_features
 
 
-def abnormal_url(url):
+def extract_feature_matrix(urls, extract=extract_features):
     """
-    Checks if the given URL does not contain its hostname, which may indicate abnormal URL patterns.
+    Extracts the features of a whole column of URLs with one fused pass per row.
 
     Args:
-        - url (str): The URL to check for abnormal patterns.
+        - urls (iterable of str): The URLs from which to extract the features.
+        - extract (callable): Function returning the feature vector of a URL, see `feature_extractor`.
 
     Returns:
-        - int: Returns 1 if the URL contains its hostname; otherwise returns 0, suggesting an abnormal pattern.
-
-    Example:
-        >>> abnormal_url("https://www.example.com/path/to/page")
-        1
+        - numpy.ndarray: An int64 matrix with one row per URL and one column per entry of `FEATURE_COLUMNS`.
     """
-    hostname = urlparse(url).hostname
-    hostname = str(hostname)
-    match = re.search(hostname, url)
-    if match:
-        return 1
-    else:
-        return 0
+    rows = [extract(url) for url in urls]
+    return np.array(rows, dtype=np.int64).reshape(len(rows), len(FEATURE_COLUMNS))
 
 
-def http_secure(url):
+def url_hash(text):
     """
-    Checks if the given URL uses the HTTPS protocol for a secure connection.
+    Returns the 64-bit BLAKE2b hash of a string, the key of the known URL index.
 
     Args:
-        - url (str): The URL to check for the use of HTTPS.
+        - text (str): The canonical URL or the domain to hash.
 
     Returns:
-        - int: Returns 1 if the URL uses HTTPS, indicating a secure connection; otherwise, returns 0.
-
-    Example:
-        >>> http_secure("https://www.example.com/path/to/page")
-        1
+        - int: The hash, as an unsigned 64-bit integer.
     """
-    htp = urlparse(url).scheme
-    match = str(htp)
-    if match == 'https':
-        return 1
-    else:
-        return 0
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
 
 
-def digit_count(url):
+def feature_schema(feature_mode='default', max_url_length=MAX_URL_LENGTH):
     """
-    Counts the number of digits in the given URL.
+    Describes everything the feature vectors depend on, the key of the vectors in the feature store.
 
     Args:
-        - url (str): The URL in which to count numeric digits.
+        - feature_mode (str): Feature extraction mode, see `feature_extractor`.
+        - max_url_length (int): Length at which URLs are truncated in the hardened mode.
 
     Returns:
-        - int: The count of numeric digits in the URL.
-
-    Example:
-        >>> digit_count("https://www.example123.com/path/to/page")
-        3
+        - dict: The version of the extraction code, the feature columns, the extraction mode and the digest of the
+          list of URL shortening services.
     """
-    digits = 0
-    for i in url:
-        if i.isnumeric():
-            digits += 1
-    return digits
+    domains = '\n'.join(sorted(shorteners.domains)).encode('utf-8')
+    return {'version': FEATURE_SCHEMA_VERSION, 'feature_columns': FEATURE_COLUMNS, 'feature_mode': feature_mode,
+            'max_url_length': max_url_length if feature_mode == 'hardened' else None,
+            'shorteners': hashlib.sha256(domains).hexdigest()}
 
 
-def letter_count(url):
+def _prepare_chunk(df, feature_mode='default', max_url_length=MAX_URL_LENGTH, store=None):
     """
-    Counts the number of alphabetic letters in the given URL.
+    Cleans a block of rows of the dataset and extracts its features.
 
     Args:
-        - url (str): The URL in which to count alphabetic letters.
+        - df (pandas.DataFrame): Rows of the dataset, with the 'url' and 'type' columns.
+        - feature_mode (str): Feature extraction mode, see `feature_extractor`.
+        - max_url_length (int): Length at which URLs are truncated in the hardened mode.
+        - store (FeatureStore or None): Store of the features already extracted, only the URLs missing from it are
+          processed.
 
     Returns:
-        - int: The count of alphabetic letters in the URL.
+        - tuple: The int64 feature matrix of the rows, the array of their category ids, the uint64 hashes of their
+          canonical URLs and of their domains (0 when the domain cannot be extracted) and the mask of the rows whose
+          features were extracted rather than read from the store.
+    """
+    df['url'] = df['url'].replace('www.', '', regex=True)
+    rem = {"Category": {"benign": 0, "defacement": 1, "phishing": 2, "malware": 3}}
+    df['Category'] = df['type']
+    df = df.replace(rem)
+
+    # Features extraction
+    df['domain'] = df['url'].apply(lambda i: process_tld(i))
+    url_hashes = np.fromiter((url_hash(url) for url in df['url']), dtype=np.uint64, count=len(df))
+    domain_hashes = np.fromiter((url_hash(domain) if isinstance(domain, str) else 0 for domain in df['domain']),
+                                dtype=np.uint64, count=len(df))
+    extract = feature_extractor(feature_mode, max_url_length)
+    if store is None:
+        features = extract_feature_matrix(df['url'], extract)
+        extracted = np.ones(len(df), dtype=bool)
+    else:
+        features, found = store.lookup(url_hashes)
+        extracted = ~found
+        features[extracted] = extract_feature_matrix(df['url'].to_numpy()[extracted], extract)
+    return features, df['Category'].to_numpy(), url_hashes, domain_hashes, extracted
 
-    Example:
-        >>> letter_count("https://www.example.com/PathToPage")
-        28
+
+def _ordered_map(func, chunks, workers):
+    """
+    Applies `func` to every chunk with a pool of `workers` processes, yielding the results in input order.
+
+    At most two chunks per worker are in flight at any time, so the chunks are read from `chunks` only as fast as
+    the pool consumes them and memory does not grow with the size of the dataset.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(func, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _collect_new_features(results, writer):
+    """
+    Passes the results of `_prepare_chunk` through, adding the features extracted for each chunk to a
+    `SegmentWriter` of the feature store as the chunk arrives.
     """
-    letters = 0
-    for i in url:
-        if i.isalpha():
-            letters += 1
-    return letters
+    for features, labels, url_hashes, domain_hashes, extracted in results:
+        writer.append(url_hashes[extracted], features[extracted])
+        yield features, labels, url_hashes, domain_hashes, extracted
 
 
-def shortening_service(url):
+def _spill_features(results, path):
     """
-    Checks if the given URL is associated with a URL shortening service.
+    Writes the feature matrices of the processed chunks to a raw int64 file as they are produced, and maps the file
+    back read-only, so the feature matrix of the whole dataset is never held in memory. The other arrays of the
+    chunks, a few bytes per row, are concatenated.
 
     Args:
-        - url (str): The URL to check for association with URL shortening services.
+        - results (iterable of tuple): The results of `_prepare_chunk` for each chunk, in order.
+        - path (pathlib.Path): Path of the file, overwritten.
 
     Returns:
-        - int: Returns 1 if the URL is associated with a URL shortening service; otherwise, returns 0.
-
-    Example:
-        >>> shortening_service("https://bit.ly/abc123")
-        1
-    """
-    match = re.search('bit\.ly|goo\.gl|shorte\.st|go2l\.ink|x\.co|ow\.ly|t\.co|tinyurl|tr\.im|is\.gd|cli\.gs|'
-                      'yfrog\.com|migre\.me|ff\.im|tiny\.cc|url4\.eu|twit\.ac|su\.pr|twurl\.nl|snipurl\.com|'
-                      'short\.to|BudURL\.com|ping\.fm|post\.ly|Just\.as|bkite\.com|snipr\.com|fic\.kr|loopt\.us|'
-                      'doiop\.com|short\.ie|kl\.am|wp\.me|rubyurl\.com|om\.ly|to\.ly|bit\.do|t\.co|lnkd\.in|'
-                      'db\.tt|qr\.ae|adf\.ly|goo\.gl|bitly\.com|cur\.lv|tinyurl\.com|ow\.ly|bit\.ly|ity\.im|'
-                      'q\.gs|is\.gd|po\.st|bc\.vc|twitthis\.com|u\.to|j\.mp|buzurl\.com|cutt\.us|u\.bb|yourls\.org|'
-                      'x\.co|prettylinkpro\.com|scrnch\.me|filoops\.info|vzturl\.com|qr\.net|1url\.com|tweez\.me|v\.gd|'
-                      'tr\.im|link\.zip\.net',
-                      url)
-    if match:
-        return 1
+        - tuple: The memory-mapped feature matrix, followed by the concatenated other arrays of `_prepare_chunk`.
+    """
+    rows, others = 0, []
+    with open(path, 'wb') as features_file:
+        for features, *arrays in results:
+            features_file.write(np.ascontiguousarray(features, dtype=np.int64).tobytes())
+            rows += len(features)
+            others.append(arrays)
+    if rows:
+        features = np.memmap(path, dtype=np.int64, mode='r', shape=(rows, len(FEATURE_COLUMNS)))
     else:
-        return 0
+        features = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.int64)
+    return (features, *(np.concatenate(arrays) for arrays in zip(*others)))
 
 
-def ip_address(url):
+def _extract_dataset(path, chunk_size=0, workers=1, feature_mode='default', max_url_length=MAX_URL_LENGTH,
+                     store=None, features_path=None):
     """
-    Checks if the given URL contains an IP address.
+    Reads the dataset and extracts the features of every row.
+
+    With a `chunk_size` the CSV is streamed in blocks of that many rows, which are processed by `workers` processes
+    and reassembled in their original order; otherwise the whole file is read and processed at once. When streaming
+    with a `features_path`, the features of each block are written to that file as soon as the block is processed
+    and the returned matrix is memory-mapped from it (see `_spill_features`), so memory does not grow with the size
+    of the dataset. With a `store` the features of the URLs already seen are read back from it, and the ones
+    extracted are added to it as one segment, collected chunk by chunk (see `_collect_new_features`).
 
     Args:
-        - url (str): The URL to check for the presence of an IP address.
+        - path (str): Path of the CSV dataset.
+        - chunk_size (int): Number of rows per block, 0 to read the whole file at once.
+        - workers (int): Number of processes extracting the features.
+        - feature_mode (str): Feature extraction mode, see `feature_extractor`.
+        - max_url_length (int): Length at which URLs are truncated in the hardened mode.
+        - store (FeatureStore or None): Store of the features already extracted.
+        - features_path (pathlib.Path or None): File receiving the feature matrix when streaming, None to keep it in
+          memory.
 
     Returns:
-        - int: Returns 1 if the URL contains an IP address; otherwise, returns 0.
-
-    Example:
-        >>> ip_address("https://192.168.0.1/path/to/page")
-        1
-    """
-    match = re.search(
-        '(([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.'
-        '([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\/)|'  # IPv4
-        '(([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\.'
-        '([01]?\\d\\d?|2[0-4]\\d|25[0-5])\\/)|'  # IPv4 with port
-        '((0x[0-9a-fA-F]{1,2})\\.(0x[0-9a-fA-F]{1,2})\\.(0x[0-9a-fA-F]{1,2})\\.(0x[0-9a-fA-F]{1,2})\\/)' # IPv4 in hexadecimal
-        '(?:[a-fA-F0-9]{1,4}:){7}[a-fA-F0-9]{1,4}|'
-        '([0-9]+(?:\.[0-9]+){3}:[0-9]+)|'
-        '((?:(?:\d|[01]?\d\d|2[0-4]\d|25[0-5])\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d|\d)(?:\/\d{1,2})?)', url)  # Ipv6
-    if match:
-        return 1
+        - tuple: The int64 feature matrix of the dataset (a `numpy.memmap` of `features_path` when streaming), the
+          array of the category ids and the hashes of the canonical URLs and of the domains, see `_prepare_chunk`.
+    """
+    prepare = partial(_prepare_chunk, feature_mode=feature_mode, max_url_length=max_url_length, store=store)
+    if workers > 1 and not chunk_size:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    writer = store.writer() if store is not None else None
+    if not chunk_size:
+        features, labels, url_hashes, domain_hashes, extracted = prepare(pd.read_csv(path))
+        if writer is not None:
+            writer.append(url_hashes[extracted], features[extracted])
     else:
-        return 0
+        chunks = pd.read_csv(path, chunksize=chunk_size)
+        if workers > 1:
+            results = _ordered_map(prepare, chunks, workers)
+        else:
+            results = map(prepare, chunks)
+        if writer is not None:
+            results = _collect_new_features(results, writer)
+        if features_path is not None:
+            features, labels, url_hashes, domain_hashes, extracted = _spill_features(results, features_path)
+        else:
+            features, labels, url_hashes, domain_hashes, extracted = (np.concatenate(arrays)
+                                                                      for arrays in zip(*results))
+
+    if writer is not None:
+        writer.close()
+        print(f'Feature store: {np.count_nonzero(~extracted)} rows cached, {np.count_nonzero(extracted)} extracted')
+    return features, labels, url_hashes, domain_hashes
+
+
+def _unanimous(hashes, labels):
+    """
+    Groups equal hashes and keeps the ones whose rows all have the same label.
 
+    Returns:
+        - tuple: The sorted unique hashes, their label and their number of rows.
+    """
+    order = np.lexsort((labels, hashes))
+    hashes, labels = hashes[order], labels[order]
+    starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    ends = np.r_[starts[1:], len(hashes)]
+    keep = labels[starts] == labels[ends - 1]
+    return hashes[starts][keep], labels[starts][keep], (ends - starts)[keep]
 
-def _load_data(args):
-    # Load dataset
-    df = pd.read_csv('malicious_phish.csv')
-    df['url'] = df['url'].replace('www.', '', regex=True)
-    rem = {"Category": {"benign": 0, "defacement": 1, "phishing": 2, "malware": 3}}
-    df['Category'] = df['type']
-    df = df.replace(rem)
 
-    # Features extraction
-    df['url_len'] = df['url'].apply(lambda x: len(str(x)))
-    df['domain'] = df['url'].apply(lambda i: process_tld(i))
-    features = ['@', '?', '-', '=', '.', '#', '%', '+', '$', '!', '*', ',', '//']
-    for feature in features:
-        df[feature] = df['url'].apply(lambda i: i.count(feature))
-    df['abnormal_url'] = df['url'].apply(lambda i: abnormal_url(i))
-    df['https'] = df['url'].apply(lambda i: http_secure(i))
-    df['digits'] = df['url'].apply(lambda i: digit_count(i))
-    df['letters'] = df['url'].apply(lambda i: letter_count(i))
-    df['shortening_service'] = df['url'].apply(lambda i: shortening_service(i))
-    df['ip_address'] = df['url'].apply(lambda i: ip_address(i))
-
-    # Test & Train split
-    x = df.drop(['url', 'type', 'Category', 'domain'], axis=1)
-    y = df['Category']
+def _save_index(directory, labels, url_hashes, domain_hashes):
+    """
+    Writes the index of the labelled URLs and domains used by the serving path before the models.
+
+    URLs and domains are stored as sorted arrays of their 64-bit hashes, with their label and their number of rows,
+    so that they can be memory-mapped and searched with a binary search. URLs or domains with conflicting labels are
+    left out.
+
+    Args:
+        - directory (pathlib.Path): Directory of the index.
+        - labels (numpy.ndarray): Category ids of the whole dataset.
+        - url_hashes (numpy.ndarray): Hashes of the canonical URLs of the dataset.
+        - domain_hashes (numpy.ndarray): Hashes of the domains of the dataset, 0 when unknown.
+    """
+    labels = labels.astype(np.int8)
+    has_domain = domain_hashes != 0
+    arrays = {}
+    for name, (hashes, label, count) in {
+            'url': _unanimous(url_hashes, labels),
+            'domain': _unanimous(domain_hashes[has_domain], labels[has_domain])}.items():
+        for suffix, array in (('hashes', hashes), ('labels', label), ('counts', count.astype(np.uint32))):
+            np.save(directory / f'{name}_{suffix}.npy', array)
+            arrays[f'{name}_{suffix}'] = {'file': f'{name}_{suffix}.npy', 'dtype': str(array.dtype),
+                                          'shape': list(array.shape)}
+    manifest = {'format_version': INDEX_FORMAT_VERSION, 'hash': 'blake2b-64', 'arrays': arrays}
+    with open(directory / 'manifest.json', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def _save_split(directory, name, scaler, features, labels, index):
+    """
+    Scales the rows of one split and writes them as typed .npy arrays.
+
+    The rows are read, scaled and copied into a memory-mapped float32 array block by block, so neither the unscaled
+    nor the scaled matrix of the split is ever held in memory. The rows of a block are read from `features` in file
+    order, which keeps the reads of a memory-mapped matrix sequential, and written back in the order of `index`.
+
+    Args:
+        - directory (pathlib.Path): Directory of the dataset.
+        - name (str): Name of the split, either 'train' or 'test'.
+        - scaler (StandardScaler): Fitted scaler.
+        - features (numpy.ndarray): Unscaled feature matrix of the whole dataset, possibly memory-mapped (see
+          `_extract_dataset`).
+        - labels (numpy.ndarray): Category ids of the whole dataset.
+        - index (numpy.ndarray): Rows of the dataset which belong to the split, in order.
+
+    Returns:
+        - dict: Manifest entries of the written arrays.
+    """
+    x_file, y_file = f'x_{name}.npy', f'y_{name}.npy'
+    x = np.lib.format.open_memmap(directory / x_file, mode='w+', dtype=np.float32,
+                                  shape=(len(index), len(FEATURE_COLUMNS)))
+    for start in range(0, len(index), WRITE_BLOCK_SIZE):
+        rows = index[start:start + WRITE_BLOCK_SIZE]
+        order = np.argsort(rows)
+        block = np.empty((len(rows), len(FEATURE_COLUMNS)), dtype=np.int64)
+        block[order] = features[rows[order]]
+        x[start:start + len(rows)] = scaler.transform(pd.DataFrame(block, columns=FEATURE_COLUMNS))
+    x.flush()
+    y = labels[index].astype(np.int16)
+    np.save(directory / y_file, y)
+
+    return {f'x_{name}': {'file': x_file, 'dtype': str(x.dtype), 'shape': list(x.shape)},
+            f'y_{name}': {'file': y_file, 'dtype': str(y.dtype), 'shape': list(y.shape)}}
+
+
+def _load_data(args):
+    # Load dataset and extract the features
+    store = None
+    if args.feature_store:
+        store = FeatureStore(args.feature_store, feature_schema(args.feature_mode, args.max_url_length),
+                             len(FEATURE_COLUMNS)).open()
+    directory = Path(args.data)
+    features_path = directory / FEATURES_SCRATCH_FILE
+    features, y, url_hashes, domain_hashes = _extract_dataset(DATASET_PATH, args.chunk_size, args.workers,
+                                                              args.feature_mode, args.max_url_length, store,
+                                                              features_path)
+    if args.index:
+        _save_index(Path(args.index), y, url_hashes, domain_hashes)
+    del url_hashes, domain_hashes
 
     scaler = StandardScaler()
-    X = scaler.fit_transform(x)
+    if isinstance(features, np.memmap):
+        # Streaming mode: the features are on disk, and the statistics of the scaler are accumulated one block at a
+        # time, like the trainers do in their streaming mode, instead of converting the whole matrix at once.
+        for start in range(0, len(features), WRITE_BLOCK_SIZE):
+            block = features[start:start + WRITE_BLOCK_SIZE]
+            scaler.partial_fit(pd.DataFrame(block, columns=FEATURE_COLUMNS))
+    else:
+        scaler.fit(pd.DataFrame(features, columns=FEATURE_COLUMNS))
     dump(scaler, args.scaler)
-    x_train, x_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=2)
-    # x_train, x_test, y_train, y_test = x_train.to_numpy(), x_test.to_numpy(), y_train.to_numpy(), y_test.to_numpy()
-    x_train, x_test = np.array(x_train), np.array(x_test)
-    y_train, y_test = np.array(y_train), np.array(y_test)
 
-    # Creates `data` structure to save and
-    # share train and test datasets.
-    data = {'x_train': x_train.tolist(), 'y_train': y_train.tolist(), 'x_test': x_test.tolist(),
-            'y_test': y_test.tolist()}
+    # Test & Train split, done on the row indices so that the scaled matrix is never materialized.
+    train_index, test_index = train_test_split(np.arange(len(features)), test_size=0.2, random_state=2)
 
-    # Creates a json object based on `data`
-    data_json = json.dumps(data)
+    # Saves the train and test datasets as typed arrays which the trainers open with `np.load(mmap_mode='r')`,
+    # together with a manifest describing them.
+    arrays = {}
+    arrays.update(_save_split(directory, 'train', scaler, features, y, train_index))
+    arrays.update(_save_split(directory, 'test', scaler, features, y, test_index))
+    del features
+    features_path.unlink(missing_ok=True)
+    manifest = {'format_version': DATASET_FORMAT_VERSION, 'feature_columns': FEATURE_COLUMNS,
+                'feature_mode': args.feature_mode, 'max_url_length': args.max_url_length, 'arrays': arrays}
+    with open(directory / 'manifest.json', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
 
-    # Saves the json object into a file
-    with open(args.data, 'w') as out_file:
-        json.dump(data_json, out_file)
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--data', type=str)
     parser.add_argument('--scaler', type=str)
+    parser.add_argument('--index', type=str, default=None,
+                        help='Directory where the index of the labelled URLs and domains will be stored.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes extracting the features.')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='Stream the dataset in blocks of this many rows (0 reads the whole file at once).')
+    parser.add_argument('--feature-mode', choices=['default', 'hardened'], default='default',
+                        help='Feature extraction mode, the serving path must use the same one (SECURL_FEATURE_MODE).')
+    parser.add_argument('--max-url-length', type=int, default=MAX_URL_LENGTH,
+                        help='Length at which URLs are truncated in the hardened mode (SECURL_MAX_URL_LENGTH).')
+    parser.add_argument('--feature-store', type=str, default='',
+                        help='Persistent directory caching the features of the URLs across runs (empty disables it).')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=PROFILE_MODE,
+                        help='Profiles the run with cProfile (cpu), tracemalloc (memory) or both (all).')
+    parser.add_argument('--profile-dir', type=str, default=None,
+                        help='Directory of the profiles, SECURL_PROFILE_DIR if not given.')
 
     args = parser.parse_args()
 
-    # Creating the directory where the output file will be created
-    # (the directory may or may not exist).
-    Path(args.data).parent.mkdir(parents=True, exist_ok=True)
+    # Creating the directory where the dataset will be stored and the one
+    # where the scaler will be created (the directories may or may not exist).
+    Path(args.data).mkdir(parents=True, exist_ok=True)
     Path(args.scaler).parent.mkdir(parents=True, exist_ok=True)
+    if args.index:
+        Path(args.index).mkdir(parents=True, exist_ok=True)
+    if args.profile_dir:
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
 
-    _load_data(args)
+    with profile('load_data', args.profile, args.profile_dir or PROFILE_DIR):
+        _load_data(args)
@@ -1,8 +1,173 @@
-from locust import HttpUser, TaskSet, task
+import csv
+import json
+import os
+import random
+import sys
+from pathlib import Path
 
-class User(HttpUser):
-    host = "http://localhost:30070"
+from locust import HttpUser, LoadTestShape, between, events
 
-    @task
-    def index(self):
-        self.client.get("/")
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'benchmarks'))
+
+from corpus import generate_corpus  # noqa: E402
+
+# Scoring API under test: the malicious-detection-api Service, `python api.py` or `benchmarks/target.py`.
+HOST = os.environ.get('SECURL_LOADTEST_HOST', 'http://localhost:8080')
+
+# URLs replayed by the users: the 'url' column of a CSV such as malicious_phish.csv, or the synthetic corpus of the
+# benchmarks when no CSV is given. At most CORPUS_SIZE URLs are used.
+CORPUS_PATH = os.environ.get('SECURL_LOADTEST_CORPUS', '')
+CORPUS_SIZE = int(os.environ.get('SECURL_LOADTEST_CORPUS_SIZE', '20000'))
+
+# Share of the requests sent to each model, as comma-separated 'name:weight' pairs.
+MODEL_WEIGHTS = {name: int(weight) for name, weight in
+                 (pair.split(':') for pair in os.environ.get('SECURL_LOADTEST_MODELS', 'rf:6,sgd:2,nb:2').split(','))}
+
+# Number of URLs of the batch requests and relative weights of the single and batch requests of each model.
+BATCH_SIZE = int(os.environ.get('SECURL_LOADTEST_BATCH_SIZE', '100'))
+SINGLE_WEIGHT = int(os.environ.get('SECURL_LOADTEST_SINGLE_WEIGHT', '9'))
+BATCH_WEIGHT = int(os.environ.get('SECURL_LOADTEST_BATCH_WEIGHT', '1'))
+
+# Mean time each user waits between two requests, in seconds.
+WAIT_TIME = float(os.environ.get('SECURL_LOADTEST_WAIT', '1'))
+
+# Load profile of `ProfileShape` (empty to set the users on the command line) and its largest number of users.
+PROFILE = os.environ.get('SECURL_LOADTEST_PROFILE', '')
+PEAK_USERS = int(os.environ.get('SECURL_LOADTEST_PEAK_USERS', '200'))
+
+# File where the summary of each model is written as JSON at the end of the test (empty to only print it).
+REPORT_PATH = os.environ.get('SECURL_LOADTEST_REPORT', '')
+
+# Stages of each profile as (end time in seconds, share of PEAK_USERS, users started per second).
+PROFILES = {
+    # Linear ramp to the peak in 10 minutes, then 5 minutes at the peak.
+    'ramp': [(60 * (i + 1), (i + 1) / 10, 1) for i in range(10)] + [(900, 1.0, 1)],
+    # Steps of an eighth of the peak every 2 minutes, to read the throughput of each level.
+    'step': [(120 * (i + 1), (i + 1) / 8, 10) for i in range(8)],
+    # A fifth of the peak, a 2 minutes spike to the peak, then back to a fifth to watch the scale down.
+    'spike': [(180, 0.2, 5), (300, 1.0, 50), (600, 0.2, 50)],
+    # Half of the peak for 30 minutes, to watch the memory and the cache over time.
+    'soak': [(1800, 0.5, 5)],
+}
+
+
+def _load_corpus():
+    """
+    Returns the URLs replayed by the users.
+    """
+    if not CORPUS_PATH:
+        return [url for url, _ in generate_corpus(CORPUS_SIZE)]
+    with open(CORPUS_PATH, newline='') as corpus_file:
+        urls = [row['url'] for row in csv.DictReader(corpus_file)]
+    if len(urls) > CORPUS_SIZE:
+        urls = random.Random(0).sample(urls, CORPUS_SIZE)
+    return urls
+
+
+URLS = _load_corpus()
+
+# Number of URLs of each batch request: distinct URLs of the corpus, so at most its size.
+BATCH_URLS = min(BATCH_SIZE, len(URLS))
+
+
+def _check(response, expected):
+    """
+    Marks a response as failed unless it is a 200 with `expected` results.
+    """
+    if response.status_code != 200:
+        response.failure(f'HTTP {response.status_code}: {response.text[:200]}')
+        return
+    try:
+        body = response.json()
+    except ValueError:
+        response.failure('The response is not JSON')
+        return
+    results = body.get('results', [body])
+    if len(results) != expected or any('label' not in result for result in results):
+        response.failure(f'Expected {expected} verdicts')
+
+
+def _single_task(model):
+    def score(user):
+        with user.client.post('/score', json={'url': random.choice(URLS), 'model': model},
+                              name=f'/score [{model}]', catch_response=True) as response:
+            _check(response, 1)
+    return score
+
+
+def _batch_task(model):
+    def score_batch(user):
+        with user.client.post('/score/batch', json={'urls': random.sample(URLS, BATCH_URLS), 'model': model},
+                              name=f'/score/batch [{model}]', catch_response=True) as response:
+            _check(response, BATCH_URLS)
+    return score_batch
+
+
+def _tasks():
+    """
+    Returns the weighted tasks of the users: a single and a batch scoring task per model of `MODEL_WEIGHTS`.
+    """
+    tasks = {}
+    for model, weight in MODEL_WEIGHTS.items():
+        tasks[_single_task(model)] = weight * SINGLE_WEIGHT
+        if BATCH_WEIGHT:
+            tasks[_batch_task(model)] = weight * BATCH_WEIGHT
+    return tasks
+
+
+class ScoringUser(HttpUser):
+    """
+    Client of the scoring API which sends URLs of the corpus to the models in the proportions of `MODEL_WEIGHTS`,
+    mostly one URL at a time and sometimes in batches. Each model and request kind is reported under its own name,
+    e.g. '/score [rf]'.
+    """
+
+    host = HOST
+    wait_time = between(0.5 * WAIT_TIME, 1.5 * WAIT_TIME)
+    tasks = _tasks()
+
+
+if PROFILE:
+    class ProfileShape(LoadTestShape):
+        """
+        Drives the number of users through the stages of the `PROFILE` profile, then stops the test.
+        """
+
+        stages = PROFILES[PROFILE]
+
+        def tick(self):
+            run_time = self.get_run_time()
+            for end, share, spawn_rate in self.stages:
+                if run_time < end:
+                    return max(1, round(share * PEAK_USERS)), spawn_rate
+            return None
+
+
+@events.test_stop.add_listener
+def _report(environment, **kwargs):
+    """
+    Prints the latency percentiles, throughput and errors of each model, and writes them to `REPORT_PATH`.
+    """
+    summary = {}
+    for (name, method), entry in sorted(environment.stats.entries.items()):
+        if not entry.num_requests:
+            continue
+        urls = BATCH_URLS if name.startswith('/score/batch') else 1
+        summary[name] = {
+            'requests': entry.num_requests,
+            'failures': entry.num_failures,
+            'error_rate': entry.num_failures / entry.num_requests,
+            'p50_ms': entry.get_response_time_percentile(0.50),
+            'p95_ms': entry.get_response_time_percentile(0.95),
+            'p99_ms': entry.get_response_time_percentile(0.99),
+            'requests_per_s': entry.total_rps,
+            'urls_per_s': entry.total_rps * urls,
+        }
+    print(f"{'request':24s} {'count':>8s} {'errors':>7s} {'p50':>7s} {'p95':>7s} {'p99':>7s} {'urls/s':>9s}")
+    for name, row in summary.items():
+        print(f"{name:24s} {row['requests']:8d} {row['error_rate']:7.2%} {row['p50_ms']:7.0f} {row['p95_ms']:7.0f} "
+              f"{row['p99_ms']:7.0f} {row['urls_per_s']:9.1f}")
+    if REPORT_PATH:
+        with open(REPORT_PATH, 'w') as report_file:
+            json.dump({'host': environment.host or HOST, 'profile': PROFILE or None, 'models': MODEL_WEIGHTS,
+                       'batch_size': BATCH_URLS, 'results': summary}, report_file, indent=2)
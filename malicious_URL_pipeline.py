@@ -94,5 +94,31 @@ def malicious_URL_pipeline():
     best_model(sgd_task.outputs['ClassificationReport'], random_forest_task.outputs['ClassificationReport'], naive_bayes_task.outputs['ClassificationReport'])
 
 
+
+@dsl.pipeline(name='Malicious URL Pipeline (shared training)',
+              description='Applies Random Forest, SGD and Naive-Bayes classifiers for Malicious URL detection problem '
+                          'in a single training step.')
+def malicious_URL_pipeline_train_all():
+    """
+    Kubeflow Pipeline for Malicious URL Detection with a single training step.
+
+    Same as `malicious_URL_pipeline`, but the three classifiers are trained by the 'train_all' component, which loads
+    the data and computes the cross-validation folds once and runs the three searches on one shared worker pool.
+    It suits a single large training node, where the separate components would each load the same data.
+    """
+
+    load = kfp.components.load_component_from_file('load_data/load_data.yaml')
+    train_all = kfp.components.load_component_from_file('train_all/train_all.yaml')
+
+    load_task = load()
+    train_task = train_all(load_task.outputs['Data'])
+
+    show_results(train_task.outputs['SGDF1-score'], train_task.outputs['RandomForestF1-score'],
+                 train_task.outputs['NaiveBayesF1-score'])
+    best_model(train_task.outputs['SGDClassificationReport'], train_task.outputs['RandomForestClassificationReport'],
+               train_task.outputs['NaiveBayesClassificationReport'])
+
+
 if __name__ == '__main__':
     kfp.compiler.Compiler().compile(malicious_URL_pipeline, 'malicious_URL_pipeline.yaml')
+    kfp.compiler.Compiler().compile(malicious_URL_pipeline_train_all, 'malicious_URL_pipeline_train_all.yaml')
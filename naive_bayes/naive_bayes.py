@@ -1,38 +1,108 @@
 import json
 import argparse
 from pathlib import Path
+from sklearn.base import clone
 from sklearn.metrics import f1_score, classification_report
 from sklearn.model_selection import GridSearchCV
 from sklearn.naive_bayes import GaussianNB
 from joblib import dump
+import numpy as np
+from profiling import PROFILE_DIR, PROFILE_MODE, PROFILE_MODES, profile
 
-def _naive_bayes(args):
+# Number of cross-validation folds of the hyperparameter search.
+CV_FOLDS = 3
+
+# Number of rows read at a time from the memory-mapped arrays in the streaming training mode and number of first rows
+# of the train set on which the hyperparameters are searched in that mode.
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_SEARCH_SAMPLES = 100000
+
+
+def _load_dataset(path):
+    """
+    Opens the train and test datasets written by the load_data component.
+
+    Args:
+        path (str): Directory of the dataset, containing a 'manifest.json' file and one .npy file per array.
+
+    Returns:
+        dict: The 'x_train', 'y_train', 'x_test' and 'y_test' arrays, memory-mapped in read-only mode.
+    """
+    directory = Path(path)
+    with open(directory / 'manifest.json') as manifest_file:
+        manifest = json.load(manifest_file)
+    return {name: np.load(directory / entry['file'], mmap_mode='r') for name, entry in manifest['arrays'].items()}
+
+
+def _chunks(n_rows, chunk_size):
+    """
+    Yields the (start, stop) bounds of the consecutive chunks of `n_rows` rows.
+    """
+    for start in range(0, n_rows, chunk_size):
+        yield start, min(start + chunk_size, n_rows)
+
+
+def _partial_fit(model, x, y, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Trains `model` incrementally with `partial_fit`, reading `chunk_size` rows of the arrays at a time.
+
+    The class means and variances of GaussianNB are exact running statistics, so a single pass over the chunks gives
+    the same model as a fit on the whole train set, up to rounding and to the variance smoothing which is computed
+    from the last chunk, while only one chunk of the memory-mapped arrays is held in memory at any time.
+
+    Args:
+        - model (GaussianNB): Unfitted estimator.
+        - x (numpy.ndarray): Training features, usually memory-mapped.
+        - y (numpy.ndarray): Training labels.
+        - chunk_size (int): Number of rows per chunk.
+
+    Returns:
+        - GaussianNB: The trained model.
+    """
+    classes = np.unique(y)
+    for start, stop in _chunks(len(y), chunk_size):
+        model.partial_fit(x[start:stop], y[start:stop], classes=classes)
+    return model
+
+
+def _predict(model, x, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Predicts the classes of the rows of `x` one chunk at a time.
+    """
+    return np.concatenate([model.predict(x[start:stop]) for start, stop in _chunks(len(x), chunk_size)])
+
+
+def _naive_bayes(args, data=None, folds=None):
     """
     Executes Naive-Bayes classification based on the provided arguments.
 
     Args:
         args (argparse.Namespace): Command-line arguments containing the paths to the input data, the output F1-score
                                    file, the classification report file and the best params file.
+        data (dict): Arrays of the dataset already opened with `_load_dataset`, read from 'args.data' if None.
+        folds (list): (train, validation) indices of the cross-validation folds of the batch training mode,
+                      `CV_FOLDS` stratified folds if None.
 
     Returns:
         None
 
-    The function reads input data from a JSON file specified by the 'args.data' parameter. The data is expected to
-    contain training and validation sets ('x_train', 'y_train', 'x_test', 'y_test'). It then trains a Gaussian NB
+    The function reads input data from the dataset directory specified by the 'args.data' parameter. The data is
+    expected to contain training and validation sets ('x_train', 'y_train', 'x_test', 'y_test'). It then trains a Gaussian NB
     model on the training data and evaluates its performance on the testing data. The F1-score is calculated using
     the 'f1_score' function from the scikit-learn library.
+    In the streaming training mode ('args.training' set to 'streaming') the hyperparameters are searched on the first
+    'args.search_samples' rows only, and the model is then trained with `partial_fit` on chunks of 'args.chunk_size'
+    rows, see `_partial_fit`, so the train set never has to fit in memory.
     Finally, the F1-score is written to an output file specified by 'args.f1-score', the best parameters are written
     in an output file specified by 'args.best_params' and the classification report is written in an output file 
     specified by 'args.classification_report.
 
     Notes:
-        - Ensure that the input data file is in JSON format and follows the expected structure.
+        - Ensure that the input data directory was written by the load_data component.
         - The output files will be overwritten if they already exist.
     """
-    with open(args.data) as data_file:
-        data = json.load(data_file)
-
-    data = json.loads(data)
+    if data is None:
+        data = _load_dataset(args.data)
     x_train = data['x_train']
     y_train = data['y_train']
     x_test = data['x_test']
@@ -42,11 +112,21 @@ def _naive_bayes(args):
 
     param_grid = {'var_smoothing': [1e-9, 1e-8, 1e-7, 1e-6, 1e-5]}
 
-    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, cv=3, scoring='f1_weighted')
-
-    grid_search.fit(x_train, y_train)
-    best_model = grid_search.best_estimator_
-    predictions = best_model.predict(x_test)
+    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, cv=CV_FOLDS, scoring='f1_weighted',
+                               n_jobs=args.n_jobs)
+
+    if args.training == 'streaming':
+        # The search runs on the first rows of the train set, already shuffled by the split, and the chosen
+        # candidate is then trained on the whole train set one chunk at a time.
+        rows = min(args.search_samples, len(y_train))
+        grid_search.fit(np.asarray(x_train[:rows]), np.asarray(y_train[:rows]))
+        best_model = _partial_fit(clone(grid_search.best_estimator_), x_train, y_train, args.chunk_size)
+    else:
+        if folds is not None:
+            grid_search.set_params(cv=folds)
+        grid_search.fit(x_train, y_train)
+        best_model = grid_search.best_estimator_
+    predictions = _predict(best_model, x_test, args.chunk_size)
     f1 = f1_score(y_test, predictions, average='weighted')
     report = classification_report(y_test, predictions)
     best_params = grid_search.best_params_
@@ -63,7 +143,10 @@ def _naive_bayes(args):
         best_params_file.write(str(best_params))
 
 
-if __name__ == '__main__':
+def _arguments():
+    """
+    Returns the parser of the command-line arguments of the trainer.
+    """
     parser = argparse.ArgumentParser(description='Training of a NaiveBayes model for malicious '
                                                  'URL detection.')
     parser.add_argument('--data', type=str)
@@ -71,12 +154,30 @@ if __name__ == '__main__':
     parser.add_argument('--classification_report', type=str)
     parser.add_argument('--best_params', type=str)
     parser.add_argument('--model', type=str)
+    parser.add_argument('--n_jobs', type=int, default=None,
+                        help='Number of parallel fits, -1 for all the cores.')
+    parser.add_argument('--training', choices=['batch', 'streaming'], default='batch',
+                        help='Fit the model on the whole train set, or incrementally one chunk at a time.')
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Number of rows per chunk in the streaming training mode.')
+    parser.add_argument('--search_samples', type=int, default=DEFAULT_SEARCH_SAMPLES,
+                        help='Number of rows on which the hyperparameters are searched in the streaming training mode.')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=PROFILE_MODE,
+                        help='Profiles the training with cProfile (cpu), tracemalloc (memory) or both (all).')
+    parser.add_argument('--profile_dir', type=str, default=None,
+                        help='Directory of the profiles, SECURL_PROFILE_DIR if not given.')
+    return parser
 
-    args = parser.parse_args()
+
+if __name__ == '__main__':
+    args = _arguments().parse_args()
 
     Path(args.f1_score).parent.mkdir(parents=True, exist_ok=True)
     Path(args.classification_report).parent.mkdir(parents=True, exist_ok=True)
     Path(args.best_params).parent.mkdir(parents=True, exist_ok=True)
     Path(args.model).parent.mkdir(parents=True, exist_ok=True)
+    if args.profile_dir:
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
 
-    _naive_bayes(args)
+    with profile('naive_bayes', args.profile, args.profile_dir or PROFILE_DIR):
+        _naive_bayes(args)
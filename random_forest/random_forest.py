@@ -1,40 +1,188 @@
 import json
+import math
+import time
 import argparse
 from pathlib import Path
+from sklearn.base import clone
 from sklearn.metrics import f1_score, classification_report
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import GridSearchCV
-from joblib import dump
+from sklearn.model_selection import GridSearchCV, ParameterGrid, StratifiedKFold
+from joblib import Parallel, delayed, dump, effective_n_jobs
+import numpy as np
+from profiling import PROFILE_DIR, PROFILE_MODE, PROFILE_MODES, profile
 
+# Number of cross-validation folds of the hyperparameter search.
+CV_FOLDS = 3
 
-def _random_forest(args):
+# Fraction of the candidates kept from one rung of the successive halving search to the next, and factor by which
+# the number of training samples grows between rungs.
+HALVING_FACTOR = 3
+
+
+def _load_dataset(path):
+    """
+    Opens the train and test datasets written by the load_data component.
+
+    Args:
+        path (str): Directory of the dataset, containing a 'manifest.json' file and one .npy file per array.
+
+    Returns:
+        dict: The 'x_train', 'y_train', 'x_test' and 'y_test' arrays, memory-mapped in read-only mode.
+    """
+    directory = Path(path)
+    with open(directory / 'manifest.json') as manifest_file:
+        manifest = json.load(manifest_file)
+    return {name: np.load(directory / entry['file'], mmap_mode='r') for name, entry in manifest['arrays'].items()}
+
+
+def _fit_and_score(model, params, x, y, train, validation):
+    """
+    Fits a copy of `model` with `params` on the `train` rows and returns its weighted F1-score on the `validation` rows.
+    """
+    estimator = clone(model).set_params(**params)
+    estimator.fit(x[train], y[train])
+    return f1_score(y[validation], estimator.predict(x[validation]), average='weighted')
+
+
+def _halving_search(model, param_grid, x, y, cv=CV_FOLDS, factor=HALVING_FACTOR, time_budget=None, n_jobs=-1,
+                    random_state=0):
+    """
+    Successive halving search over the training samples.
+
+    Every candidate is first cross-validated on a small random subset of each training fold; only the best
+    1/`factor` of the candidates are kept for the next rung, which trains on `factor` times more samples, until the
+    last rung trains the remaining candidates on the whole folds. The fits of a rung are dispatched in chunks of
+    candidates, with the (candidate, fold) fits of a chunk running in parallel on `n_jobs` processes.
+
+    With a `time_budget`, the elapsed time is checked before each chunk: the search stops when the chunk would end
+    past the budget, expecting it to last as long as the previous one (`factor` times longer for the first chunk of a
+    rung, which trains on `factor` times more samples). The durations of the rungs are not known in advance, as the
+    cost of a fit grows faster than its number of samples and the first rung pays the overhead of the most fits. Only
+    the first chunk of the search always runs. When the search stops inside a rung, the best candidate among the ones
+    scored in that rung is chosen: the candidates are scored in the order of the previous rung, so they include its
+    best one, evaluated on more samples.
+
+    Args:
+        - model (RandomForestClassifier): Estimator whose parameters are searched.
+        - param_grid (dict): Candidate values of each parameter.
+        - x (numpy.ndarray): Training features.
+        - y (numpy.ndarray): Training labels.
+        - cv (int or list): Number of stratified cross-validation folds, or the (train, validation) indices of each fold.
+        - factor (int): Ratio between the numbers of candidates, and of samples, of two consecutive rungs.
+        - time_budget (float or None): Wall-clock budget of the search in seconds, None for no budget.
+        - n_jobs (int): Number of parallel fits, -1 for all the cores.
+        - random_state (int): Seed of the folds and of the subsets of the samples.
+
+    Returns:
+        - tuple: The best parameters, their mean validation F1-score and the search report, with the candidates
+          scored, samples, best score, duration and completion of each rung.
+    """
+    start = time.perf_counter()
+    candidates = list(ParameterGrid(param_grid))
+    rng = np.random.RandomState(random_state)
+    if isinstance(cv, int):
+        cv = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state).split(np.zeros(len(y)), y)
+    folds = [(rng.permutation(train), validation) for train, validation in cv]
+    # Candidates per chunk: enough (candidate, fold) fits to keep every process busy.
+    chunk_size = max(1, math.ceil(effective_n_jobs(n_jobs) / len(folds)))
+
+    n_rungs, remaining = 1, len(candidates)
+    while remaining > factor:
+        remaining = math.ceil(remaining / factor)
+        n_rungs += 1
+
+    rungs = []
+    best_params, best_score = candidates[0], None
+    expected_chunk_seconds, exhausted = None, False
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for rung in range(n_rungs):
+            fraction = float(factor) ** (rung - n_rungs + 1)
+            subsets = [np.sort(train[:max(1, int(len(train) * fraction))]) for train, _ in folds]
+            if expected_chunk_seconds is not None:
+                expected_chunk_seconds *= factor
+            rung_start = time.perf_counter()
+            scores = []
+            for first in range(0, len(candidates), chunk_size):
+                elapsed = time.perf_counter() - start
+                if (time_budget is not None and expected_chunk_seconds is not None
+                        and elapsed + expected_chunk_seconds > time_budget):
+                    exhausted = True
+                    break
+                chunk_start = time.perf_counter()
+                scores.extend(parallel(delayed(_fit_and_score)(model, params, x, y, subset, validation)
+                                       for params in candidates[first:first + chunk_size]
+                                       for subset, (_, validation) in zip(subsets, folds)))
+                expected_chunk_seconds = time.perf_counter() - chunk_start
+            if not scores:
+                break
+            scored = candidates[:len(scores) // len(folds)]
+            mean_scores = np.asarray(scores).reshape(len(scored), len(folds)).mean(axis=1)
+            order = np.argsort(-mean_scores, kind='stable')
+            best_params, best_score = scored[order[0]], float(mean_scores[order[0]])
+            rungs.append({'candidates': len(scored), 'complete': len(scored) == len(candidates),
+                          'samples_per_fold': len(subsets[0]), 'best_score': best_score,
+                          'seconds': time.perf_counter() - rung_start})
+            if exhausted:
+                break
+            candidates = [candidates[i] for i in order[:math.ceil(len(candidates) / factor)]]
+
+    report = {'search': 'halving', 'factor': factor, 'cv': len(folds), 'time_budget': time_budget,
+              'budget_exhausted': exhausted, 'rungs': rungs, 'best_params': best_params,
+              'best_score': best_score, 'search_seconds': time.perf_counter() - start}
+    return best_params, best_score, report
+
+
+def _grid_search(model, param_grid, x, y, cv=CV_FOLDS, n_jobs=-1):
+    """
+    Exhaustive grid search, with the fits of the candidates and folds running in parallel on `n_jobs` processes.
+    `cv` is the number of stratified folds or the (train, validation) indices of each fold.
+
+    Returns:
+        - tuple: The best parameters, their mean validation F1-score and the search report.
+    """
+    start = time.perf_counter()
+    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, cv=cv, scoring='f1_weighted', n_jobs=n_jobs,
+                               refit=False)
+    grid_search.fit(x, y)
+    report = {'search': 'grid', 'cv': cv if isinstance(cv, int) else len(cv), 'candidates': len(grid_search.cv_results_['params']),
+              'best_params': grid_search.best_params_, 'best_score': float(grid_search.best_score_),
+              'mean_fit_seconds': float(np.mean(grid_search.cv_results_['mean_fit_time'])),
+              'search_seconds': time.perf_counter() - start}
+    return grid_search.best_params_, float(grid_search.best_score_), report
+
+
+def _random_forest(args, data=None, folds=None):
     """
     Executes a random forest classification based on the provided arguments.
 
     Args:
         args (argparse.Namespace): Command-line arguments containing the paths to the input data, the output F1-score
                                    file, the classification report file and the best params file.
+        data (dict): Arrays of the dataset already opened with `_load_dataset`, read from 'args.data' if None.
+        folds (list): (train, validation) indices of the cross-validation folds, `CV_FOLDS` stratified folds if None.
 
     Returns:
         None
 
-    The function reads input data from a JSON file specified by the 'args.data' parameter. The data is expected to
-    contain training and testing sets ('x_train', 'y_train', 'x_test', 'y_test'). It then trains a
+    The function reads input data from the dataset directory specified by the 'args.data' parameter. The data is
+    expected to contain training and testing sets ('x_train', 'y_train', 'x_test', 'y_test'). It then trains a
     RandomForestClassifier on the training data and evaluates its performance on the testing data. The F1-score is
     calculated using the 'f1_score' function from the scikit-learn library.
+    The hyperparameters are chosen by a successive halving search ('args.search' set to 'halving', see
+    `_halving_search`) or by an exhaustive grid search ('grid'), both running their fits on 'args.n_jobs' processes.
     Finally, the F1-score is written to an output file specified by 'args.f1-score', the best parameters are written
-    in an output file specified by 'args.best_params' and the classification report is written in an output file 
-    specified by 'args.classification_report.
+    in an output file specified by 'args.best_params', the classification report is written in an output file 
+    specified by 'args.classification_report' and the rungs, scores and timings of the search in an output file
+    specified by 'args.search_report'.
 
     Notes:
-        - Ensure that the input data file is in JSON format and follows the expected structure.
+        - Ensure that the input data directory was written by the load_data component.
         - The output files will be overwritten if they already exist.
     """
 
-    with open(args.data) as data_file:
-        data = json.load(data_file)
-
-    data = json.loads(data)
+    if data is None:
+        data = _load_dataset(args.data)
+    cv = folds if folds is not None else CV_FOLDS
     x_train = data['x_train']
     y_train = data['y_train']
     x_test = data['x_test']
@@ -47,14 +195,23 @@ def _random_forest(args):
         'bootstrap': [True, False]
     }
 
-    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, cv=3, scoring='f1_weighted')
-    grid_search.fit(x_train, y_train)
+    if args.search == 'halving':
+        best_params, _, search_report = _halving_search(model, param_grid, x_train, y_train, cv,
+                                                        time_budget=args.time_budget or None, n_jobs=args.n_jobs)
+    else:
+        best_params, _, search_report = _grid_search(model, param_grid, x_train, y_train, cv, args.n_jobs)
+
+    # Refits the chosen candidate on the whole train set, with its trees built on all the cores.
+    refit_start = time.perf_counter()
+    best_model = clone(model).set_params(**best_params, n_jobs=args.n_jobs)
+    best_model.fit(x_train, y_train)
+    search_report['refit_seconds'] = time.perf_counter() - refit_start
+    # The served model predicts one URL at a time, where spawning a thread per core only adds overhead.
+    best_model.set_params(n_jobs=None)
 
-    best_model = grid_search.best_estimator_
     predictions = best_model.predict(x_test)
     f1 = f1_score(y_test, predictions, average='weighted')
     report = classification_report(y_test, predictions)
-    best_params = grid_search.best_params_
     dump(best_model, args.model)
 
     with open(args.f1_score, 'w') as f1_score_file:
@@ -66,20 +223,47 @@ def _random_forest(args):
     with open(args.best_params, 'w') as best_params_file:
         best_params_file.write(str(best_params))
 
+    if args.search_report:
+        with open(args.search_report, 'w') as search_report_file:
+            json.dump(search_report, search_report_file, indent=2, default=str)
 
-if __name__ == '__main__':
+
+def _arguments():
+    """
+    Returns the parser of the command-line arguments of the trainer.
+    """
     parser = argparse.ArgumentParser(description='Training of a random forest classifier for malicious URL detection.')
     parser.add_argument('--data', type=str)
     parser.add_argument('--f1_score', type=str)
     parser.add_argument('--classification_report', type=str)
     parser.add_argument('--best_params', type=str)
     parser.add_argument('--model', type=str)
+    parser.add_argument('--search_report', type=str, default=None,
+                        help='Path of the JSON report of the hyperparameter search.')
+    parser.add_argument('--search', choices=['halving', 'grid'], default='halving',
+                        help='Successive halving search over the samples, or exhaustive grid search.')
+    parser.add_argument('--time_budget', type=float, default=0,
+                        help='Wall-clock budget of the halving search in seconds, 0 for no budget.')
+    parser.add_argument('--n_jobs', type=int, default=-1,
+                        help='Number of parallel fits, -1 for all the cores.')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=PROFILE_MODE,
+                        help='Profiles the training with cProfile (cpu), tracemalloc (memory) or both (all).')
+    parser.add_argument('--profile_dir', type=str, default=None,
+                        help='Directory of the profiles, SECURL_PROFILE_DIR if not given.')
+    return parser
 
-    args = parser.parse_args()
+
+if __name__ == '__main__':
+    args = _arguments().parse_args()
 
     Path(args.f1_score).parent.mkdir(parents=True, exist_ok=True)
     Path(args.classification_report).parent.mkdir(parents=True, exist_ok=True)
     Path(args.best_params).parent.mkdir(parents=True, exist_ok=True)
     Path(args.model).parent.mkdir(parents=True, exist_ok=True)
+    if args.search_report:
+        Path(args.search_report).parent.mkdir(parents=True, exist_ok=True)
+    if args.profile_dir:
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
 
-    _random_forest(args)
+    with profile('random_forest', args.profile, args.profile_dir or PROFILE_DIR):
+        _random_forest(args)
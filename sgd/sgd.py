@@ -1,39 +1,177 @@
 import json
+import time
 import argparse
 from pathlib import Path
+from sklearn.base import clone
 from sklearn.metrics import f1_score, classification_report
 from sklearn.linear_model import SGDClassifier
-from sklearn.model_selection import GridSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401, enables HalvingRandomSearchCV
+from sklearn.model_selection import GridSearchCV, HalvingRandomSearchCV, ParameterGrid
 from joblib import dump
+import numpy as np
+from profiling import PROFILE_DIR, PROFILE_MODE, PROFILE_MODES, profile
 
-def _sgd(args):
+# Number of cross-validation folds of the hyperparameter search.
+CV_FOLDS = 3
+
+# Number of candidates sampled from the grid by the halving search, and fraction of them kept from one iteration to
+# the next, which is also the factor by which the number of training samples grows.
+HALVING_CANDIDATES = 128
+HALVING_FACTOR = 3
+
+# Number of rows read at a time from the memory-mapped arrays in the streaming training mode, number of passes over
+# the train set and number of its first rows on which the hyperparameters are searched in that mode.
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_EPOCHS = 5
+DEFAULT_SEARCH_SAMPLES = 100000
+
+
+def _load_dataset(path):
+    """
+    Opens the train and test datasets written by the load_data component.
+
+    Args:
+        path (str): Directory of the dataset, containing a 'manifest.json' file and one .npy file per array.
+
+    Returns:
+        dict: The 'x_train', 'y_train', 'x_test' and 'y_test' arrays, memory-mapped in read-only mode.
+    """
+    directory = Path(path)
+    with open(directory / 'manifest.json') as manifest_file:
+        manifest = json.load(manifest_file)
+    return {name: np.load(directory / entry['file'], mmap_mode='r') for name, entry in manifest['arrays'].items()}
+
+
+def _chunks(n_rows, chunk_size, rng=None):
+    """
+    Yields the (start, stop) bounds of the consecutive chunks of `n_rows` rows, in a random order if `rng` is given.
+    """
+    starts = np.arange(0, n_rows, chunk_size)
+    if rng is not None:
+        rng.shuffle(starts)
+    for start in starts:
+        yield start, min(start + chunk_size, n_rows)
+
+
+def _partial_fit(model, x, y, chunk_size=DEFAULT_CHUNK_SIZE, epochs=DEFAULT_EPOCHS, random_state=0):
+    """
+    Trains `model` incrementally with `partial_fit`, reading `chunk_size` rows of the arrays at a time.
+
+    Each epoch visits the chunks in a random order and shuffles the rows of each chunk, so only one chunk of the
+    memory-mapped arrays is held in memory at any time.
+
+    Args:
+        - model (SGDClassifier): Unfitted estimator.
+        - x (numpy.ndarray): Training features, usually memory-mapped.
+        - y (numpy.ndarray): Training labels.
+        - chunk_size (int): Number of rows per chunk.
+        - epochs (int): Number of passes over the whole train set.
+        - random_state (int): Seed of the order of the chunks and of their rows.
+
+    Returns:
+        - SGDClassifier: The trained model.
+    """
+    rng = np.random.RandomState(random_state)
+    classes = np.unique(y)
+    for _ in range(epochs):
+        for start, stop in _chunks(len(y), chunk_size, rng):
+            order = rng.permutation(stop - start)
+            model.partial_fit(x[start:stop][order], y[start:stop][order], classes=classes)
+    return model
+
+
+def _predict(model, x, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Predicts the classes of the rows of `x` one chunk at a time.
+    """
+    return np.concatenate([model.predict(x[start:stop]) for start, stop in _chunks(len(x), chunk_size)])
+
+
+def _search(model, param_grid, x, y, search='halving', n_candidates=HALVING_CANDIDATES, n_jobs=-1,
+            random_state=0, cv=CV_FOLDS):
+    """
+    Searches the hyperparameters of the SGD classifier, with the fits of the candidates running on `n_jobs` processes.
+
+    The halving search samples `n_candidates` distinct candidates from the grid and evaluates them all on a small
+    subset of the training samples; at each iteration only the best 1/`HALVING_FACTOR` of them are kept and
+    evaluated on `HALVING_FACTOR` times more samples, so poor candidates are dropped after a few cheap fits and only
+    the last few are trained on the whole folds. The grid search evaluates every candidate on the whole folds.
+
+    Args:
+        - model (SGDClassifier): Estimator whose parameters are searched.
+        - param_grid (dict): Candidate values of each parameter.
+        - x (numpy.ndarray): Training features.
+        - y (numpy.ndarray): Training labels.
+        - search (str): 'halving' or 'grid'.
+        - n_candidates (int): Number of candidates sampled by the halving search.
+        - n_jobs (int): Number of parallel fits, -1 for all the cores.
+        - random_state (int): Seed of the sampling of the candidates and of the samples.
+        - cv (int or list): Number of stratified cross-validation folds, or the (train, validation) indices of each fold.
+
+    Returns:
+        - tuple: The fitted search and its report, with the fraction of the grid explored, the candidates and samples
+          of each iteration, the number of fits and the timings.
+    """
+    start = time.perf_counter()
+    space_size = len(ParameterGrid(param_grid))
+    n_folds = cv if isinstance(cv, int) else len(cv)
+    if search == 'halving':
+        searcher = HalvingRandomSearchCV(estimator=model, param_distributions=param_grid,
+                                         n_candidates=min(n_candidates, space_size), factor=HALVING_FACTOR,
+                                         resource='n_samples', min_resources='exhaust', cv=cv,
+                                         scoring='f1_weighted', n_jobs=n_jobs, random_state=random_state)
+    else:
+        searcher = GridSearchCV(estimator=model, param_grid=param_grid, cv=cv, scoring='f1_weighted',
+                                n_jobs=n_jobs)
+    searcher.fit(x, y)
+
+    explored = searcher.n_candidates_[0] if search == 'halving' else space_size
+    report = {'search': search, 'space_size': space_size, 'candidates_explored': int(explored),
+              'explored_fraction': explored / space_size, 'cv': n_folds,
+              'fits': len(searcher.cv_results_['params']) * n_folds,
+              'best_params': searcher.best_params_, 'best_score': float(searcher.best_score_),
+              'search_seconds': time.perf_counter() - start, 'refit_seconds': searcher.refit_time_}
+    if search == 'halving':
+        report['iterations'] = [{'candidates': int(candidates), 'samples': int(samples)} for candidates, samples
+                                in zip(searcher.n_candidates_, searcher.n_resources_)]
+    return searcher, report
+
+
+def _sgd(args, data=None, folds=None):
     """
     Executes Stochastic Gradient Descent (SGD) classification based on the provided arguments.
 
     Args:
         args (argparse.Namespace): Command-line arguments containing the paths to the input data, the output F1-score
                                    file, the classification report file and the best params file.
+        data (dict): Arrays of the dataset already opened with `_load_dataset`, read from 'args.data' if None.
+        folds (list): (train, validation) indices of the cross-validation folds of the batch training mode,
+                      `CV_FOLDS` stratified folds if None.
 
     Returns:
         None
 
-    The function reads input data from a JSON file specified by the 'args.data' parameter. The data is expected to
-    contain training and testing sets ('x_train', 'y_train', 'x_test', 'y_test'). It then trains an SGDClassifier on the
+    The function reads input data from the dataset directory specified by the 'args.data' parameter. The data is
+    expected to contain training and testing sets ('x_train', 'y_train', 'x_test', 'y_test'). It then trains an SGDClassifier on the
     training data and evaluates its performance on the testing data. The F1-score is calculated using the
     'f1_score' function from the scikit-learn library.
+    The hyperparameters are chosen by a successive halving search over a random sample of the grid ('args.search'
+    set to 'halving') or by an exhaustive grid search ('grid'), see `_search`. In the streaming training mode
+    ('args.training' set to 'streaming') they are searched on the first 'args.search_samples' rows only, and the model
+    is then trained with `partial_fit` over 'args.epochs' passes on chunks of 'args.chunk_size' rows, see
+    `_partial_fit`, so the train set never has to fit in memory.
     Finally, the F1-score is written to an output file specified by 'args.f1-score', the best parameters are written
-    in an output file specified by 'args.best_params' and the classification report is written in an output file 
-    specified by 'args.classification_report.
+    in an output file specified by 'args.best_params', the classification report is written in an output file 
+    specified by 'args.classification_report' and the explored fraction of the grid and the timings of the search in
+    an output file specified by 'args.search_report'.
 
     Notes:
-        - Ensure that the input data file is in JSON format and follows the expected structure.
+        - Ensure that the input data directory was written by the load_data component.
         - The output files will be overwritten if they already exists.
     """
 
-    with open(args.data) as data_file:
-        data = json.load(data_file)
-
-    data = json.loads(data)
+    if data is None:
+        data = _load_dataset(args.data)
     x_train = data['x_train']
     y_train = data['y_train']
     x_test = data['x_test']
@@ -41,20 +179,29 @@ def _sgd(args):
 
     model = SGDClassifier()
     param_grid = {
-        'loss': ['hinge', 'log', 'perceptron'],
+        'loss': ['hinge', 'log_loss', 'perceptron'],
         'penalty': ['l1', 'l2', 'elasticnet'],
         'alpha': [0.0001, 0.001, 0.01],
         'learning_rate': ['constant', 'optimal', 'invscaling', 'adaptive'],
         'eta0': [0.01, 0.1, 1],
         'max_iter': [4000, 5000, 6000],  # Reducing the range for faster computation
-        'n_jobs': [-1],
     }
 
-    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, cv=3, scoring='f1_weighted')
-
-    grid_search.fit(x_train, y_train)
-    best_model = grid_search.best_estimator_
-    predictions = best_model.predict(x_test)
+    if args.training == 'streaming':
+        # The search runs on the first rows of the train set, already shuffled by the split, and the chosen
+        # candidate is then trained on the whole train set one chunk at a time.
+        rows = min(args.search_samples, len(y_train))
+        grid_search, search_report = _search(model, param_grid, np.asarray(x_train[:rows]),
+                                             np.asarray(y_train[:rows]), args.search, args.n_candidates, args.n_jobs)
+        training_start = time.perf_counter()
+        best_model = _partial_fit(clone(grid_search.best_estimator_), x_train, y_train, args.chunk_size, args.epochs)
+        search_report.update({'training': 'streaming', 'search_samples': rows, 'chunk_size': args.chunk_size,
+                              'epochs': args.epochs, 'training_seconds': time.perf_counter() - training_start})
+    else:
+        grid_search, search_report = _search(model, param_grid, x_train, y_train, args.search, args.n_candidates,
+                                             args.n_jobs, cv=folds if folds is not None else CV_FOLDS)
+        best_model = grid_search.best_estimator_
+    predictions = _predict(best_model, x_test, args.chunk_size)
     f1 = f1_score(y_test, predictions, average='weighted')
     report = classification_report(y_test, predictions)
     best_params = grid_search.best_params_
@@ -69,8 +216,15 @@ def _sgd(args):
     with open(args.best_params, 'w') as best_params_file:
         best_params_file.write(str(best_params))
 
+    if args.search_report:
+        with open(args.search_report, 'w') as search_report_file:
+            json.dump(search_report, search_report_file, indent=2, default=str)
 
-if __name__ == '__main__':
+
+def _arguments():
+    """
+    Returns the parser of the command-line arguments of the trainer.
+    """
     parser = argparse.ArgumentParser(description='Training of a Stochastic Gradient Descent classifier for malicious '
                                                  'URL detection.')
     parser.add_argument('--data', type=str)
@@ -78,12 +232,40 @@ if __name__ == '__main__':
     parser.add_argument('--classification_report', type=str)
     parser.add_argument('--best_params', type=str)
     parser.add_argument('--model', type=str)
+    parser.add_argument('--search_report', type=str, default=None,
+                        help='Path of the JSON report of the hyperparameter search.')
+    parser.add_argument('--search', choices=['halving', 'grid'], default='halving',
+                        help='Successive halving search over sampled candidates, or exhaustive grid search.')
+    parser.add_argument('--n_candidates', type=int, default=HALVING_CANDIDATES,
+                        help='Number of candidates sampled from the grid by the halving search.')
+    parser.add_argument('--n_jobs', type=int, default=-1,
+                        help='Number of parallel fits, -1 for all the cores.')
+    parser.add_argument('--training', choices=['batch', 'streaming'], default='batch',
+                        help='Fit the model on the whole train set, or incrementally one chunk at a time.')
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Number of rows per chunk in the streaming training mode.')
+    parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS,
+                        help='Number of passes over the train set in the streaming training mode.')
+    parser.add_argument('--search_samples', type=int, default=DEFAULT_SEARCH_SAMPLES,
+                        help='Number of rows on which the hyperparameters are searched in the streaming training mode.')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=PROFILE_MODE,
+                        help='Profiles the training with cProfile (cpu), tracemalloc (memory) or both (all).')
+    parser.add_argument('--profile_dir', type=str, default=None,
+                        help='Directory of the profiles, SECURL_PROFILE_DIR if not given.')
+    return parser
 
-    args = parser.parse_args()
+
+if __name__ == '__main__':
+    args = _arguments().parse_args()
 
     Path(args.f1_score).parent.mkdir(parents=True, exist_ok=True)
     Path(args.classification_report).parent.mkdir(parents=True, exist_ok=True)
     Path(args.best_params).parent.mkdir(parents=True, exist_ok=True)
     Path(args.model).parent.mkdir(parents=True, exist_ok=True)
+    if args.search_report:
+        Path(args.search_report).parent.mkdir(parents=True, exist_ok=True)
+    if args.profile_dir:
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
 
-    _sgd(args)
+    with profile('sgd', args.profile, args.profile_dir or PROFILE_DIR):
+        _sgd(args)
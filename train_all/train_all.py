@@ -0,0 +1,101 @@
+import argparse
+import shlex
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+# The trainers and `profiling.py` are copied next to this file in the image, and live in the sibling directories and
+# in app/url_utilities in the repository.
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path.extend(str(_ROOT / directory) for directory in ('random_forest', 'sgd', 'naive_bayes', 'app/url_utilities'))
+
+import naive_bayes  # noqa: E402
+import random_forest  # noqa: E402
+import sgd  # noqa: E402
+
+# Trainers run by the orchestrator: module, training function and output options, by prefix of their arguments.
+TRAINERS = {
+    'rf': (random_forest, random_forest._random_forest,
+           ('f1_score', 'classification_report', 'best_params', 'model', 'search_report')),
+    'sgd': (sgd, sgd._sgd, ('f1_score', 'classification_report', 'best_params', 'model', 'search_report')),
+    'nb': (naive_bayes, naive_bayes._naive_bayes, ('f1_score', 'classification_report', 'best_params', 'model')),
+}
+
+# Number of cross-validation folds shared by the three searches.
+CV_FOLDS = 3
+
+
+def _trainer_args(args, prefix):
+    """
+    Builds the command-line arguments of one trainer from the ones of the orchestrator.
+
+    The output paths are given as '--<prefix>_<output>' options, and '--<prefix>_args' holds any other option of the
+    trainer (e.g. '--search grid'). Every trainer uses the shared `--n_jobs`.
+
+    Returns:
+        - argparse.Namespace: The arguments of the trainer, with its own defaults.
+    """
+    module, _, outputs = TRAINERS[prefix]
+    argv = ['--data', args.data, '--n_jobs', str(args.n_jobs)]
+    for output in outputs:
+        path = getattr(args, f'{prefix}_{output}')
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            argv += [f'--{output}', path]
+    argv += shlex.split(getattr(args, f'{prefix}_args'))
+    return module._arguments().parse_args(argv)
+
+
+def _train_all(args):
+    """
+    Trains the random forest, SGD and Naive-Bayes classifiers in a single process.
+
+    The dataset is memory-mapped once and the indices of the stratified cross-validation folds are computed once,
+    then the three trainers run concurrently in threads on these shared arrays. Their parallel fits all go to the
+    single process pool that joblib reuses within a process, whose workers map the same dataset files instead of
+    receiving copies, so the cores left idle by a search which finished early pick up the fits of the others. Each
+    trainer writes the same outputs as its own component.
+
+    Args:
+        args (argparse.Namespace): Command-line arguments containing the path to the input data and the output paths
+                                   of each trainer.
+    """
+    data = random_forest._load_dataset(args.data)
+    y_train = data['y_train']
+    folds = list(StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=0)
+                 .split(np.zeros(len(y_train)), y_train))
+
+    def train(prefix):
+        start = time.perf_counter()
+        _, function, _ = TRAINERS[prefix]
+        function(_trainer_args(args, prefix), data, folds)
+        print(f'{prefix}: trained in {time.perf_counter() - start:.1f}s')
+
+    with ThreadPoolExecutor(max_workers=len(TRAINERS)) as executor:
+        for future in [executor.submit(train, prefix) for prefix in TRAINERS]:
+            future.result()
+
+
+def _arguments():
+    """
+    Returns the parser of the command-line arguments of the orchestrator.
+    """
+    parser = argparse.ArgumentParser(description='Training of the random forest, SGD and Naive-Bayes classifiers for '
+                                                 'malicious URL detection on a shared dataset and worker pool.')
+    parser.add_argument('--data', type=str)
+    parser.add_argument('--n_jobs', type=int, default=-1,
+                        help='Number of parallel fits of each search, -1 for all the cores.')
+    for prefix, (_, _, outputs) in TRAINERS.items():
+        for output in outputs:
+            parser.add_argument(f'--{prefix}_{output}', type=str, default=None)
+        parser.add_argument(f'--{prefix}_args', type=str, default='',
+                            help='Other options of the trainer, e.g. "--search grid".')
+    return parser
+
+
+if __name__ == '__main__':
+    _train_all(_arguments().parse_args())